@@ -0,0 +1,58 @@
+import random
+import time
+
+from utils.common.Messages import RBMessage
+from utils.worker.ReliableBroadcast import RBInstance
+
+# times how long one node takes to handle a reliable broadcast message, as the network grows and more broadcasts are
+# in flight at once. votes are tallied per value and instances are looked up by subject, so the cost per message
+# should stay flat in both.
+
+NODE_COUNTS = [4, 16, 64]  # network sizes
+IN_FLIGHT = [10, 100, 1000]  # broadcasts running at once
+SEED = 1  # seed of the delivery order
+
+
+class NullClient:
+    """
+    Stands in for the mqtt client, dropping whatever is published.
+    """
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        pass
+
+
+def run(rng: random.Random, n: int, in_flight: int) -> float:
+    """
+    Delivers every message of in_flight broadcasts among n nodes to one node, interleaved at random.
+    Returns the mean time spent per message, in microseconds.
+    """
+    nodes = [f"node{i}" for i in range(n)]
+    client = NullClient()
+    messages = []
+    for b in range(in_flight):
+        subject = f"results/job/node0/{b}"
+        data = rng.randbytes(64).hex()
+        messages.append(RBMessage("initial", subject, data, nodes[0]))
+        messages.extend(RBMessage(state, subject, data, node) for state in ("echo", "ready") for node in nodes)
+    rng.shuffle(messages)
+
+    broadcasts: dict[str, RBInstance] = {}
+    start = time.perf_counter()
+    for message in messages:
+        rb = broadcasts.get(message.subject)
+        if rb is None:
+            rb = RBInstance(client, nodes, message.subject, nodes[1])
+            broadcasts[message.subject] = rb
+        rb.handle_message(message)
+    elapsed = time.perf_counter() - start
+    assert all(rb.accepted for rb in broadcasts.values())
+    return elapsed / len(messages) * 1e6
+
+
+if __name__ == "__main__":
+    rng = random.Random(SEED)
+    print("per message cost in µs, by nodes (rows) and broadcasts in flight (columns)")
+    print("nodes " + "".join(f"{b:>10}" for b in IN_FLIGHT))
+    for n in NODE_COUNTS:
+        print(f"{n:<6}" + "".join(f"{run(rng, n, b):>10.2f}" for b in IN_FLIGHT))
@@ -0,0 +1,212 @@
+import json
+import random
+import time
+import tracemalloc
+
+from utils.common.Codec import BinaryCodec, JSONCodec
+from utils.common.Messages import FrameResults, Heartbeat, Message, RBMessage, TaskCommand
+from utils.worker.Config import RESULT_BATCH_SIZE
+
+# compares the message paths on the messages nodes exchange most: the binary codec, the JSON codec, and the messages
+# from before the codecs, which built a dict per message, went through json.dumps/loads and had a finalizer each.
+# for each message it reports the payload size, the time to build and encode it and to decode it, and the peak memory
+# allocated while doing so.
+
+ROUNDS = 20000  # encodes and decodes timed per message and path
+SEED = 1  # seed of the frame results
+
+
+# the message classes from before the codecs, kept as they were apart from the fields added since, so every path
+# carries the same contents.
+
+
+class LegacyMessage:
+    def __init__(self, content: dict = {}):
+        self.content = content
+
+    def encode_message(self) -> str:
+        return json.dumps(self.content)
+
+    def __del__(self):
+        del self.content
+
+
+class LegacyRBMessage(LegacyMessage):
+    def __init__(self, state: str, subject: str, data: str, sender: str = ""):
+        super().__init__({})
+        self.state = state
+        self.subject = subject
+        self.data = data
+        self.sender = sender
+
+        self.content["state"] = state
+        self.content["subject"] = subject
+        self.content["data"] = data
+        self.content["sender"] = sender
+
+    def __del__(self):
+        del self.content
+
+
+def legacy_rbmessage_decode(content: str) -> LegacyRBMessage:
+    d = json.loads(content)
+    return LegacyRBMessage(d["state"], d["subject"], d["data"], d.get("sender", ""))
+
+
+class LegacyHeartbeat(LegacyMessage):
+    def __init__(self, node="", status="", slots=1, fps=0.0, queue=0, jobs=None):
+        super().__init__({})
+        self.node = node
+        self.status = status
+        self.slots = slots
+        self.fps = fps
+        self.queue = queue
+        self.jobs = jobs if jobs is not None else []
+
+        self.content["node"] = node
+        self.content["status"] = status
+        self.content["slots"] = slots
+        self.content["fps"] = fps
+        self.content["queue"] = queue
+        self.content["jobs"] = self.jobs
+
+    def __del__(self):
+        del self.content
+
+
+def legacy_heartbeat_decode(content: str) -> LegacyHeartbeat:
+    data = json.loads(content)
+    return LegacyHeartbeat(
+        data["node"], data["status"], data.get("slots", 1), data.get("fps", 0.0), data.get("queue", 0), data["jobs"]
+    )
+
+
+class LegacyTaskCommand(LegacyMessage):
+    def __init__(self, start=0, end=0, job="", step=1):
+        super().__init__({})
+        self.start = start
+        self.end = end
+        self.job = job
+        self.step = step
+
+        self.content["start"] = start
+        self.content["end"] = end
+        self.content["job"] = job
+        self.content["step"] = step
+
+    def __del__(self):
+        del self.content
+
+
+def legacy_taskcommand_decode(content: str) -> LegacyTaskCommand:
+    data = json.loads(content)
+    return LegacyTaskCommand(data["start"], data["end"], data["job"], data["step"])
+
+
+class LegacyFrameResults(LegacyMessage):
+    def __init__(self, results: dict[int, int] = None):
+        super().__init__({})
+        self.results = results if results is not None else {}
+
+        self.content["results"] = {str(frame): hits for frame, hits in self.results.items()}
+
+    def __del__(self):
+        del self.content
+
+
+def legacy_frameresults_decode(content: str) -> LegacyFrameResults:
+    data = json.loads(content)
+    return LegacyFrameResults({int(frame): hits for frame, hits in data["results"].items()})
+
+
+LEGACY = {
+    RBMessage: (LegacyRBMessage, legacy_rbmessage_decode),
+    Heartbeat: (LegacyHeartbeat, legacy_heartbeat_decode),
+    TaskCommand: (LegacyTaskCommand, legacy_taskcommand_decode),
+    FrameResults: (LegacyFrameResults, legacy_frameresults_decode),
+}  # legacy class and decoder of each message class
+
+
+def sample_messages(rng: random.Random) -> list[tuple[str, Message, LegacyMessage]]:
+    """
+    Returns one message of each kind that is sent per frame or per heartbeat, with realistic contents, and the same
+    message as it was built before the codecs.
+    """
+    results = {frame: rng.randrange(4) for frame in range(1000, 1000 + RESULT_BATCH_SIZE)}
+    data = FrameResults(results).encode_message()
+    legacy_data = LegacyFrameResults(results).encode_message()
+    subject = "results/job-1/worker-3/7"
+    heartbeat = ("worker-3", "ready", 2, 24.37, 120, ["job-1", "job-2"])
+    return [
+        ("Heartbeat", Heartbeat(*heartbeat), LegacyHeartbeat(*heartbeat)),
+        ("TaskCommand", TaskCommand(1200, 1260, "job-1"), LegacyTaskCommand(1200, 1260, "job-1")),
+        ("FrameResults", FrameResults(results), LegacyFrameResults(results)),
+        (
+            "RBMessage/initial",
+            RBMessage("initial", subject, data, "worker-3"),
+            LegacyRBMessage("initial", subject, legacy_data, "worker-3"),
+        ),
+        (
+            "RBMessage/echo",
+            RBMessage("echo", subject, data, "worker-1"),
+            LegacyRBMessage("echo", subject, legacy_data, "worker-1"),
+        ),
+    ]
+
+
+def paths(message: Message, legacy: LegacyMessage) -> dict:
+    """
+    Returns, per path, functions that build and encode the message, and that decode its payload into a message.
+    """
+    cls = type(message)
+    values = message.values()
+    legacy_cls, legacy_decode = LEGACY[cls]
+    legacy_values = [getattr(legacy, field) for field in cls.fields]
+    out = {}
+    for name, codec in (("binary", BinaryCodec()), ("json", JSONCodec())):
+        payload = codec.encode(values)
+        out[name] = (
+            lambda codec=codec: codec.encode(cls(*values).values()),
+            lambda codec=codec, payload=payload: cls(*codec.decode(payload)),
+            payload,
+        )
+    legacy_payload = legacy.encode_message().encode()
+    out["legacy"] = (
+        lambda: legacy_cls(*legacy_values).encode_message().encode(),
+        lambda: legacy_decode(legacy_payload),
+        legacy_payload,
+    )
+    return out
+
+
+def timed(fn) -> float:
+    """Returns the mean time of a call, in microseconds."""
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def peak_memory(fn) -> int:
+    """Returns the most memory a call had allocated at once, in bytes."""
+    fn()  # warm caches so they aren't counted
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == "__main__":
+    columns = ["bytes", "encode µs", "decode µs", "enc peak B", "dec peak B"]
+    print(f"{'message':<18}{'path':<8}" + "".join(f"{column:>12}" for column in columns))
+    for name, message, legacy in sample_messages(random.Random(SEED)):
+        for path, (encode, decode, payload) in paths(message, legacy).items():
+            decoded = decode()
+            assert [getattr(decoded, field) for field in type(message).fields] == [
+                getattr(message if path != "legacy" else legacy, field) for field in type(message).fields
+            ], f"{name} doesn't round-trip through {path}"
+            print(
+                f"{name:<18}{path:<8}{len(payload):>12}{timed(encode):>12.2f}{timed(decode):>12.2f}"
+                f"{peak_memory(encode):>12}{peak_memory(decode):>12}"
+            )
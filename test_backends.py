@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import sys
+
+# checks that every exported inference backend counts the same hits as the PyTorch model, over the frames of the test
+# video. exports are cached next to the model, so only the first run pays for them.
+
+VIDEO = "test_video.mp4"  # video the backends are compared on
+MODEL = os.path.join("utils", "worker", "yolo12n.pt")  # model the workers run
+BACKENDS = ["onnx", "openvino", "torchscript"]  # backends compared against pytorch
+FRAME_STEP = 5  # compare every n-th frame, to keep the run short
+TARGET = 76  # class counted in each frame
+TOLERANCE = 0.02  # max fraction of frames whose hits may differ from pytorch
+
+
+def read_frames(path: str, step: int) -> list:
+    """Returns every step-th frame of a video."""
+    import cv2 as cv
+
+    cap = cv.VideoCapture(path)
+    frames = []
+    index = 0
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if index % step == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def predict_all(predictor, frames: list) -> list[int]:
+    """Returns the hits in each frame, in batches of BATCH_SIZE."""
+    from utils.worker.Config import BATCH_SIZE
+
+    hits = []
+    for start in range(0, len(frames), BATCH_SIZE):
+        hits.extend(predictor.image_predict_batch(frames[start : start + BATCH_SIZE], target=TARGET))
+    return hits
+
+
+if __name__ == "__main__":
+    if importlib.util.find_spec("ultralytics") is None:
+        print("ultralytics is not installed, skipping")
+        sys.exit(0)
+    from utils.worker.ImagePredict import ImagePredictor, export_model
+
+    frames = read_frames(VIDEO, FRAME_STEP)
+    expected = predict_all(ImagePredictor(MODEL, backend="pytorch"), frames)
+    print(f"pytorch: {sum(expected)} hits over {len(frames)} frames")
+
+    failed = False
+    for backend in BACKENDS:
+        if export_model(MODEL, backend) == MODEL:
+            print(f"{backend}: couldn't be exported, skipping")
+            continue
+        hits = predict_all(ImagePredictor(MODEL, backend=backend), frames)
+        differing = [i * FRAME_STEP for i, (a, b) in enumerate(zip(expected, hits)) if a != b]
+        print(f"{backend}: {sum(hits)} hits, {len(differing)} frames differ {differing[:10]}")
+        if len(differing) > TOLERANCE * len(frames):
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,86 @@
+import random
+
+from utils.common.Messages import RBMessage, rbmessage_decode
+from utils.worker.ReliableBroadcast import RBInstance, broadcast_topic, parse_broadcast_topic
+
+# runs reliable broadcasts between simulated nodes, without a broker. every message is delivered to every node in a
+# random order, some of them more than once, and the run checks that all nodes accept the same data while each sends
+# exactly one echo and one ready.
+
+NODE_COUNTS = [1, 2, 3, 4, 7, 10]  # network sizes to simulate
+RUNS = 50  # broadcasts per network size and mode
+DUPLICATE_RATE = 0.3  # chance a delivered message is delivered again later
+SEED = 1  # seed of the delivery order
+
+
+class StubClient:
+    """
+    Stands in for a node's mqtt client, queueing what it publishes on the simulated network.
+    """
+
+    def __init__(self, network: list[tuple[str, bytes]]):
+        self.network = network  # messages published and not yet delivered, shared by all nodes
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        self.network.append((topic, payload))
+
+
+def run_broadcast(rng: random.Random, n: int, use_hash: bool) -> int:
+    """
+    Broadcasts one message from the first of n nodes and delivers everything until the network is quiet.
+    Returns the number of messages published.
+    """
+    nodes = [f"node{i}" for i in range(n)]
+    subject = f"test/{n}/{rng.getrandbits(32)}"
+    data = rng.randbytes(64).hex()
+    network: list[tuple[str, bytes]] = []
+    clients = {node: StubClient(network) for node in nodes}
+    instances: dict[str, RBInstance] = {}
+    accepted: dict[str, str] = {}
+
+    initial = RBMessage("initial", subject, data, nodes[0])
+    clients[nodes[0]].publish(broadcast_topic(subject, "initial"), initial.encode_message())
+
+    published = 0
+    inboxes: dict[str, list[bytes]] = {node: [] for node in nodes}
+    while True:
+        # everything published so far reaches every node, the sender included, in any order
+        for topic, payload in network:
+            assert parse_broadcast_topic(topic)[0] == subject
+            published += 1
+            for node in nodes:
+                inboxes[node].append(payload)
+        network.clear()
+        pending = [node for node in nodes if inboxes[node]]
+        if not pending:
+            break
+        node = rng.choice(pending)
+        inbox = inboxes[node]
+        payload = inbox.pop(rng.randrange(len(inbox)))
+        if rng.random() < DUPLICATE_RATE:
+            inbox.append(payload)
+
+        rb = instances.get(node)
+        if rb is None:
+            rb = RBInstance(clients[node], nodes, subject, node, use_hash=use_hash)
+            instances[node] = rb
+        out = rb.handle_message(rbmessage_decode(payload))
+        if out is not None:
+            assert node not in accepted, f"{node} accepted twice"
+            accepted[node] = out.data
+
+    assert accepted == {node: data for node in nodes}, f"not every node accepted the data: {sorted(accepted)}"
+    for node, rb in instances.items():
+        assert rb.echoed and rb.readied, f"{node} skipped its echo or ready"
+    # the initial, plus one echo and one ready per node, however often messages were duplicated
+    assert published == 1 + 2 * n, f"{published} messages published for {n} nodes"
+    return published
+
+
+if __name__ == "__main__":
+    rng = random.Random(SEED)
+    for use_hash in (False, True):
+        for n in NODE_COUNTS:
+            total = sum(run_broadcast(rng, n, use_hash) for _ in range(RUNS))
+            print(f"n={n:<3} hash={use_hash!s:<5} {RUNS} broadcasts, {total / RUNS:.0f} messages each")
+    print("OK")
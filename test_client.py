@@ -10,15 +10,17 @@ import sys  # noqa
 import tempfile
 import threading
 import time
-from base64 import b64decode, b64encode  # noqa
+from io import BytesIO
 import random
 
 from nicegui import ui
 from nicegui.events import UploadEventArguments
 from paho.mqtt import client as MQTT
-from utils.common.Messages import Heartbeat, VideoRequest, heartbeat_decode
+from utils.common.ChunkTransfer import ChunkFileAssembler, build_manifest, chunk_decode, send_chunks
+from utils.common.Membership import Membership, heartbeat_topic, parse_heartbeat_topic
+from utils.common.Messages import Heartbeat, VideoRequest, heartbeat_decode, transfermanifest_decode
 from utils.common.MQTT_Broker import MQTT_HOST, MQTT_PORT
-from utils.common.Topics import CLIENT_TOPIC, HEARTBEAT_TOPIC, REQUEST_INBOX  # noqa
+from utils.common.Topics import CHUNK_INBOX, CLIENT_TOPIC, HEARTBEAT_TOPIC, REQUEST_INBOX  # noqa
 
 
 class DistributedVideoProcessingApp:
@@ -29,11 +31,11 @@ class DistributedVideoProcessingApp:
         self.input_video_name = None
         self.temp_input_video_path = None
         self.temp_processed_video_path = None
+        self.result_transfers: dict[str, ChunkFileAssembler] = {}  # processed videos being received, by transfer id
         self.processing_start_ts = None
         self.processing_end_ts = None
         # Worker nodes
-        self.nodes: list[str] = []
-        self.node_ping: list[str] = []
+        self.membership = Membership()
 
         # MQTT set up
         self.client_name = client_name  # mqtt client name
@@ -142,68 +144,85 @@ class DistributedVideoProcessingApp:
         self._setup_ui()
 
     def _heartbeat_timeout_loop(self):
-        """Updates the list of available nodes on a loop. Meant to run in a thread."""
+        """Drops nodes that stopped sending heartbeats on a loop. Meant to run in a thread."""
         while True:
-            self.nodes = self.node_ping
-            self.node_ping = []
+            self.membership.expire()
             time.sleep(1)
 
+    @property
+    def nodes(self) -> list[str]:
+        """The available nodes."""
+        return self.membership.nodes()
+
     def _heartbeat_cb(self, message: Heartbeat):
         """Callback for node heartbeat messages."""
-        node = message.node
-        if node not in self.node_ping:
-            self.node_ping.append(node)
+        self.membership.update(message)
 
     def _on_connect(self, client: MQTT.Client, userdata, flags, reason_code, properties):
         """MQTT Client on connect, subscribe to topics."""
-        client.subscribe(f"{HEARTBEAT_TOPIC}")
+        client.subscribe(heartbeat_topic("+"))
         client.subscribe(f"{CLIENT_TOPIC}")
+        client.subscribe(f"{CLIENT_TOPIC}/{CHUNK_INBOX}")
 
     def _on_message(self, client: MQTT.Client, userdata, message: MQTT.MQTTMessage):
         """MQTT Client on message receipt, do callbacks."""
-        if message.topic.endswith(HEARTBEAT_TOPIC):
-            hb = heartbeat_decode(message.payload.decode())
+        if message.topic.startswith(f"{HEARTBEAT_TOPIC}/"):
+            if not message.payload:  # the node left
+                self.membership.remove(parse_heartbeat_topic(message.topic))
+                return
+            hb = heartbeat_decode(message.payload)
             self._heartbeat_cb(hb)
+        if message.topic.endswith(CHUNK_INBOX):
+            transfer, offset, data = chunk_decode(message.payload)
+            if self._get_result(transfer).add_chunk(offset, data):
+                self._result_done(transfer)
         if message.topic.endswith(CLIENT_TOPIC):
-            ################################################################################
-            # Process the video and display the result
-            self.processed_video = b64decode(message.payload.decode())
-            # try:
-            #     if self.temp_processed_video_path and os.path.exists(self.temp_processed_video_path):
-            #         os.remove(self.temp_processed_video_path)
-            # except Exception as e:
-            #     ui.notify(f"Error deleting previous video: {str(e)}", type="negative")
-            #     self.update_status(f"Error deleting previous video: {str(e)}")
-
-            self.temp_processed_video_path = None
-            self.processed_video_preview.clear()
-
-            # Create a temporary file for the video preview            
-            
-            
-            output_video_path = "/home/ryank/School/distributed-predict/output-video-tmp.mp4"
-            output_h264_path = f"/home/ryank/School/distributed-predict/output-video-{random.random()}.mp4"
-
-            
-            with open(output_video_path, "wb") as f:
-                f.write(self.processed_video)
-                
-            os.system(f"ffmpeg -y -i {output_video_path} -an -vcodec libx264 -crf 23 {output_h264_path}")
-            os.remove(output_video_path)
-                
-            self.temp_processed_video_path = output_h264_path
+            manifest = transfermanifest_decode(message.payload)
+            if self._get_result(manifest.transfer).set_manifest(manifest):
+                self._result_done(manifest.transfer)
+
+    def _get_result(self, transfer: str) -> ChunkFileAssembler:
+        """Returns the file a processed video is being written to, creating it if needed."""
+        if transfer not in self.result_transfers:
+            self.result_transfers[transfer] = ChunkFileAssembler(transfer)
+        return self.result_transfers[transfer]
+
+    def _result_done(self, transfer: str):
+        """Displays a processed video once all of it has been written to disk."""
+        result = self.result_transfers.pop(transfer)
+        result.close()
+        ################################################################################
+        # Process the video and display the result
+        # try:
+        #     if self.temp_processed_video_path and os.path.exists(self.temp_processed_video_path):
+        #         os.remove(self.temp_processed_video_path)
+        # except Exception as e:
+        #     ui.notify(f"Error deleting previous video: {str(e)}", type="negative")
+        #     self.update_status(f"Error deleting previous video: {str(e)}")
 
-            # Show the video preview
-            with self.processed_video_preview:
-                with ui.card().classes("max-w-[400px] max-h-[400px] items-center justify-center"):
-                    ui.label("Processed Video:").classes("text-lg text-gray-700 mb-2 mx-auto")
-                    ui.video(self.temp_processed_video_path, autoplay=True, muted=True, loop=False).classes(
-                        "object-contain mx-auto"
-                    )
-            self.update_status("Received processed video.")
-            self.processing_end_ts = time.time()
-            self.update_status(f"Total processing time: {round(self.processing_end_ts - self.processing_start_ts, 2)} seconds.")
-            ################################################################################
+        self.temp_processed_video_path = None
+        self.processed_video_preview.clear()
+
+        # Create a temporary file for the video preview
+        output_video_path = result.name
+        output_h264_path = f"/home/ryank/School/distributed-predict/output-video-{random.random()}.mp4"
+
+        os.system(f"ffmpeg -y -i {output_video_path} -an -vcodec libx264 -crf 23 {output_h264_path}")
+        os.remove(output_video_path)
+
+        self.temp_processed_video_path = output_h264_path
+
+        # Show the video preview
+        with self.processed_video_preview:
+            with ui.card().classes("max-w-[400px] max-h-[400px] items-center justify-center"):
+                ui.label("Processed Video:").classes("text-lg text-gray-700 mb-2 mx-auto")
+                ui.video(self.temp_processed_video_path, autoplay=True, muted=True, loop=False).classes(
+                    "object-contain mx-auto"
+                )
+        self.update_status("Received processed video.")
+        self.processing_end_ts = time.time()
+        self.update_status(f"Total processing time: {round(self.processing_end_ts - self.processing_start_ts, 2)} seconds.")
+        ################################################################################
 
     def _mqtt_connect(self, host, port):
         """Connects the MQTT client to the broker, and starts the heartbeat loop."""
@@ -300,7 +319,7 @@ class DistributedVideoProcessingApp:
             e.content.seek(0)
             content_data = e.content.read()
             self.uploaded_content = e
-            self.input_video_data = b64encode(content_data).decode()
+            self.input_video_data = content_data
             self.input_video_name = e.name
 
             # Create a temporary file for the video preview
@@ -359,11 +378,14 @@ class DistributedVideoProcessingApp:
         ################################################################################
         # Send the request over MQTT
         try:
-            request = VideoRequest(self.input_video_data, selected_class)
-            print(f"Sending message to {self.nodes[0]}")
-            self.update_status(f"Sending message to {self.nodes[0]}")
-            self.client.publish(f"/{self.nodes[0]}/{REQUEST_INBOX}", request.encode_message())
+            video = BytesIO(self.input_video_data)
+            request = VideoRequest(selected_class, build_manifest(video))
+            node = self.nodes[0]
+            print(f"Sending message to {node}")
+            self.update_status(f"Sending message to {node}")
             self.processing_start_ts = time.time()
+            self.client.publish(f"/{node}/{REQUEST_INBOX}", request.encode_message())
+            send_chunks(self.client, f"/{node}/{CHUNK_INBOX}", request.manifest, video)
 
         except Exception as e:
             ui.notify(f"Error sending message: {str(e)}", type="negative")
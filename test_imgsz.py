@@ -0,0 +1,86 @@
+import importlib.util
+import os
+import sys
+import time
+
+# reports what lowering the inference size costs in accuracy and buys in speed, over the frames of the test video.
+# every size is compared against 640, the default, frame by frame.
+
+VIDEO = "test_video.mp4"  # video the sizes are compared on
+MODEL = os.path.join("utils", "worker", "yolo12n.pt")  # model the workers run
+REFERENCE_SIZE = 640  # inference size the others are compared against
+SIZES = [480, 416, 320, 256]  # inference sizes compared
+FRAME_STEP = 5  # compare every n-th frame, to keep the run short
+TARGET = 76  # class counted in each frame
+
+
+def read_frames(path: str, step: int, imgsz: int) -> list:
+    """Returns every step-th frame of a video, scaled down so its longest side is at most imgsz, as workers do."""
+    import cv2 as cv
+
+    cap = cv.VideoCapture(path)
+    frames = []
+    index = 0
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if index % step == 0:
+            rows, cols = frame.shape[:2]
+            scale = min(1.0, imgsz / max(rows, cols))
+            if scale < 1.0:
+                frame = cv.resize(frame, (round(cols * scale), round(rows * scale)), interpolation=cv.INTER_AREA)
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def predict_all(predictor, frames: list, imgsz: int) -> tuple[list[int], float]:
+    """Returns the hits in each frame, in batches of BATCH_SIZE, and the mean seconds spent per frame."""
+    from utils.worker.Config import BATCH_SIZE
+
+    hits = []
+    start = time.perf_counter()
+    for batch in range(0, len(frames), BATCH_SIZE):
+        hits.extend(predictor.image_predict_batch(frames[batch : batch + BATCH_SIZE], target=TARGET, imgsz=imgsz))
+    return hits, (time.perf_counter() - start) / max(1, len(frames))
+
+
+if __name__ == "__main__":
+    if importlib.util.find_spec("ultralytics") is None:
+        print("ultralytics is not installed, skipping")
+        sys.exit(0)
+    from utils.worker.ImagePredict import ImagePredictor
+    from utils.worker.MaxSubarray import MaxSubarrayTree
+
+    predictor = ImagePredictor(MODEL)
+
+    def run(imgsz: int) -> tuple[list[int], float]:
+        frames = read_frames(VIDEO, FRAME_STEP, imgsz)
+        predictor.warm_up(frames[0].shape[:2])  # so the first batch doesn't pay for setting up this size
+        return predict_all(predictor, frames, imgsz)
+
+    def best_window(hits: list[int]) -> tuple[int, int]:
+        tree = MaxSubarrayTree(len(hits))
+        for frame, count in enumerate(hits):
+            tree.update(frame, count if count > 0 else -1)
+        start, end = tree.best()
+        return start * FRAME_STEP, end * FRAME_STEP
+
+    expected, reference_time = run(REFERENCE_SIZE)
+    print(
+        f"imgsz {REFERENCE_SIZE}: {sum(expected)} hits over {len(expected)} frames, "
+        f"{reference_time * 1000:.1f} ms/frame, best window {best_window(expected)}"
+    )
+    for imgsz in SIZES:
+        hits, per_frame = run(imgsz)
+        differences = [b - a for a, b in zip(expected, hits)]
+        differing = sum(1 for difference in differences if difference)
+        print(
+            f"imgsz {imgsz}: {sum(hits)} hits, {differing}/{len(hits)} frames differ "
+            f"(mean abs {sum(map(abs, differences)) / len(hits):.2f}), {per_frame * 1000:.1f} ms/frame "
+            f"({reference_time / per_frame:.2f}x), best window {best_window(hits)}"
+        )
+        changed = {i * FRAME_STEP: difference for i, difference in enumerate(differences) if difference}
+        print(f"  hit differences by frame: {changed}")
@@ -1,10 +1,11 @@
 import threading
 import time
-from base64 import b64encode
 
 from paho.mqtt import client as MQTT
+from utils.common.ChunkTransfer import build_manifest, send_chunks
+from utils.common.Membership import Membership, heartbeat_topic, parse_heartbeat_topic
 from utils.common.Messages import Heartbeat, VideoRequest, heartbeat_decode
-from utils.common.Topics import HEARTBEAT_TOPIC, REQUEST_INBOX
+from utils.common.Topics import CHUNK_INBOX, HEARTBEAT_TOPIC, REQUEST_INBOX
 
 # MQTT network info. Broker always takes 192.168.0.2
 MQTT_HOST = "192.168.1.130"  # broker ip
@@ -16,31 +17,29 @@ client_name = "tester"
 # mqtt client
 client = MQTT.Client(MQTT.CallbackAPIVersion.VERSION2, client_id=client_name)
 
-nodes: list[str] = []
-node_ping: list[str] = []
+membership = Membership()
 
 
 def heartbeat_timeout_loop():
-    global nodes, node_ping
     while True:
-        nodes = node_ping
-        node_ping = []
+        membership.expire()
         time.sleep(1)
 
 
 def heartbeat_cb(message: Heartbeat):
-    node = message.node
-    if node not in node_ping:
-        node_ping.append(node)
+    membership.update(message)
 
 
 def on_connect(client: MQTT.Client, userdata, flags, reason_code, properties):
-    client.subscribe(f"{HEARTBEAT_TOPIC}")
+    client.subscribe(heartbeat_topic("+"))
 
 
 def on_message(client: MQTT.Client, userdata, message: MQTT.MQTTMessage):
-    if message.topic.endswith(HEARTBEAT_TOPIC):
-        hb = heartbeat_decode(message.payload.decode())
+    if message.topic.startswith(f"{HEARTBEAT_TOPIC}/"):
+        if not message.payload:  # the node left
+            membership.remove(parse_heartbeat_topic(message.topic))
+            return
+        hb = heartbeat_decode(message.payload)
         heartbeat_cb(hb)
 
 
@@ -54,10 +53,10 @@ client.connect(MQTT_HOST, MQTT_PORT)
 client.loop_start()
 threading.Thread(target=heartbeat_timeout_loop, daemon=True).start()
 time.sleep(2)
-video = ""
+nodes = membership.nodes()
 with open("test_video.mp4", "rb") as f:
-    video = f.read()
-vr = VideoRequest(b64encode(video).decode(), 76)
-print(f"Sending message to {nodes[0]}")
-client.publish(f"/{nodes[0]}/{REQUEST_INBOX}", vr.encode_message())
+    vr = VideoRequest(76, build_manifest(f))
+    print(f"Sending message to {nodes[0]}")
+    client.publish(f"/{nodes[0]}/{REQUEST_INBOX}", vr.encode_message())
+    send_chunks(client, f"/{nodes[0]}/{CHUNK_INBOX}", vr.manifest, f)
 time.sleep(1)
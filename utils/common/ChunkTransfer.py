@@ -0,0 +1,279 @@
+import os
+import secrets
+import struct
+import tempfile
+from hashlib import sha256
+from typing import BinaryIO
+
+from paho.mqtt import client as MQTTClient
+
+from .Messages import TransferManifest
+
+CHUNK_SIZE = 256 * 1024  # default size of a transfer chunk, in bytes
+CHUNK_HEADER = struct.Struct("!16sQ")  # header of a binary chunk: transfer id, byte offset
+
+
+def chunk_encode(transfer: str, offset: int, data: bytes) -> bytes:
+    """Packs a piece of a transfer into a binary MQTT payload."""
+    return CHUNK_HEADER.pack(transfer.encode(), offset) + data
+
+
+def chunk_decode(payload: bytes) -> tuple[str, int, memoryview]:
+    """Unpacks a binary MQTT payload into its transfer id, byte offset and data."""
+    transfer, offset = CHUNK_HEADER.unpack_from(payload)
+    return transfer.decode(), offset, memoryview(payload)[CHUNK_HEADER.size :]
+
+
+def build_manifest(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> TransferManifest:
+    """
+    Builds the manifest for sending a stream in chunks. The stream is read once to hash it, then rewound.
+    """
+    digest = sha256()
+    size = 0
+    block = stream.read(chunk_size)
+    while block:
+        digest.update(block)
+        size += len(block)
+        block = stream.read(chunk_size)
+    stream.seek(0)
+
+    chunks = (size + chunk_size - 1) // chunk_size
+    return TransferManifest(secrets.token_hex(8), size, chunk_size, chunks, digest.hexdigest())
+
+
+def send_chunks(client: MQTTClient.Client, topic: str, manifest: TransferManifest, stream: BinaryIO):
+    """
+    Publishes a stream to a topic as binary chunks, one chunk in memory at a time.
+    """
+    offset = 0
+    block = stream.read(manifest.chunk_size)
+    while block:
+        client.publish(topic, chunk_encode(manifest.transfer, offset, block), qos=1)
+        offset += len(block)
+        block = stream.read(manifest.chunk_size)
+
+
+class ChunkStreamer:
+    """
+    Publishes a file as binary chunks while something else is still writing it, so sending overlaps with encoding.
+    Every full chunk past the first is sent as soon as it is on disk. The first chunk is held back until the file is
+    finished, since video containers patch their header when they are closed. The manifest comes last, once the size
+    and digest are known.
+    """
+
+    def __init__(self, client: MQTTClient.Client, topic: str, path: str, chunk_size: int = CHUNK_SIZE):
+        self.client = client  # mqtt client
+        self.topic = topic  # topic the chunks are published on
+        self.path = path  # file being written
+        self.chunk_size = chunk_size  # size of a chunk, in bytes
+        self.transfer = secrets.token_hex(8)  # id of the transfer
+        self.offset = chunk_size  # offset of the next chunk to send
+        self.file = open(path, "rb")  # separate handle, so the writer's position is left alone
+
+    def send(self, offset: int, size: int) -> int:
+        self.file.seek(offset)
+        block = self.file.read(size)
+        if block:
+            self.client.publish(self.topic, chunk_encode(self.transfer, offset, block), qos=1)
+        return len(block)
+
+    def pump(self):
+        """
+        Sends every full chunk the writer has finished since the last call.
+        """
+        size = os.fstat(self.file.fileno()).st_size
+        while self.offset + self.chunk_size <= size:
+            self.offset += self.send(self.offset, self.chunk_size)
+
+    def finish(self) -> TransferManifest:
+        """
+        Sends the rest of the finished file and the held back first chunk, and returns the transfer's manifest.
+        """
+        self.pump()
+        while self.send(self.offset, self.chunk_size):
+            self.offset += self.chunk_size
+        self.send(0, self.chunk_size)
+
+        self.file.seek(0)
+        manifest = build_manifest(self.file, self.chunk_size)
+        manifest.transfer = self.transfer
+        self.file.close()
+        return manifest
+
+
+class BufferReader:
+    """
+    Read-only file-like view over a buffer, for readers that take a stream (send_chunks, OpenCV's stream captures)
+    without copying the whole buffer first.
+    """
+
+    def __init__(self, buffer: bytearray):
+        self.view = memoryview(buffer).toreadonly()  # the buffer being read
+        self.position = 0  # offset of the next read
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size is None or size < 0 else min(self.position + size, len(self.view))
+        data = bytes(self.view[self.position : end])
+        self.position = end
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += len(self.view)
+        self.position = max(0, min(offset, len(self.view)))
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self):
+        self.view.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ChunkReceiver:
+    """
+    Bookkeeping shared by the ways a chunked transfer is received: which chunks have arrived, and whether the finished
+    transfer matches its manifest. Chunks can arrive before the manifest and in any order, since each one carries its
+    own offset. Subclasses decide where the bytes are stored.
+    """
+
+    def __init__(self, transfer: str):
+        self.transfer = transfer  # id of the transfer being assembled
+        self.manifest: TransferManifest = None  # manifest of the transfer, once known
+        self.received: set[int] = set()  # offsets of the chunks written so far
+        self.received_bytes = 0  # number of bytes written so far
+        self.verified = False  # whether the finished transfer matched the manifest's digest
+
+    def set_manifest(self, manifest: TransferManifest) -> bool:
+        """
+        Sets the manifest of the transfer. Returns True if this finished the transfer.
+        """
+        self.manifest = manifest
+        if not self.verified:
+            self._reserve(manifest.size)
+        return self.complete()
+
+    def add_chunk(self, offset: int, data: memoryview) -> bool:
+        """
+        Stores a chunk at its offset. Returns True if this chunk finished the transfer.
+        """
+        if offset in self.received or self.verified:
+            return False
+        self._write(offset, data)
+        self.received.add(offset)
+        self.received_bytes += len(data)
+        return self.complete()
+
+    def complete(self) -> bool:
+        """
+        Checks whether every byte of the transfer has arrived, and verifies the digest once it has.
+        """
+        if self.verified:
+            return True
+        if self.manifest is None or self.received_bytes < self.manifest.size:
+            return False
+
+        self.verified = self._digest(self.manifest.size) == self.manifest.digest
+        if not self.verified:
+            print(f"Transfer {self.transfer} failed verification")
+        return self.verified
+
+    def _reserve(self, size: int):
+        # makes room for the whole transfer, once its size is known
+        pass
+
+    def _write(self, offset: int, data: memoryview):
+        raise NotImplementedError
+
+    def _digest(self, size: int) -> str:
+        # cuts the stored bytes down to the transfer's size, and returns their sha256 digest
+        raise NotImplementedError
+
+
+class ChunkAssembler(ChunkReceiver):
+    """
+    Reassembles a chunked transfer in memory as the chunks arrive, copying each payload exactly once.
+    A file copy is only written if something asks for the transfer's file name.
+    """
+
+    def __init__(self, transfer: str, suffix: str = ".mp4"):
+        super().__init__(transfer)
+        self.suffix = suffix  # suffix of the file copy
+        self.buffer = bytearray()  # the transfer's bytes, written straight from the chunk payloads
+        self.file = None  # file copy of the buffer, for readers that need a path
+
+    @property
+    def name(self) -> str:
+        """
+        Returns the name of a file holding the finished transfer, writing it on first use.
+        """
+        if self.file is None:
+            self.file = tempfile.NamedTemporaryFile(suffix=self.suffix)
+            self.file.write(self.buffer)
+            self.file.flush()
+        return self.file.name
+
+    def reader(self) -> BufferReader:
+        """
+        Returns a file-like reader over the finished transfer.
+        """
+        return BufferReader(self.buffer)
+
+    def _reserve(self, size: int):
+        if len(self.buffer) < size:
+            self.buffer += bytes(size - len(self.buffer))
+
+    def _write(self, offset: int, data: memoryview):
+        end = offset + len(data)
+        if end > len(self.buffer):
+            self.buffer += bytes(end - len(self.buffer))
+        self.buffer[offset:end] = data
+
+    def _digest(self, size: int) -> str:
+        del self.buffer[size:]
+        with memoryview(self.buffer) as view:
+            return sha256(view).hexdigest()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.buffer = bytearray()
+
+
+class ChunkFileAssembler(ChunkReceiver):
+    """
+    Reassembles a chunked transfer straight into a file on disk, writing each chunk at its offset as it arrives.
+    Used where the transfer should not be held in memory, like a client receiving a clip.
+    """
+
+    def __init__(self, transfer: str, suffix: str = ".mp4"):
+        super().__init__(transfer)
+        fd, self.name = tempfile.mkstemp(suffix=suffix)  # file the transfer is written to
+        self.file = os.fdopen(fd, "w+b")
+
+    def _write(self, offset: int, data: memoryview):
+        self.file.seek(offset)
+        self.file.write(data)
+
+    def _digest(self, size: int) -> str:
+        self.file.truncate(size)
+        self.file.flush()
+        self.file.seek(0)
+        digest = sha256()
+        for block in iter(lambda: self.file.read(self.manifest.chunk_size or CHUNK_SIZE), b""):
+            digest.update(block)
+        return digest.hexdigest()
+
+    def close(self):
+        """
+        Closes the file, leaving it on disk for whoever the transfer was for.
+        """
+        self.file.close()
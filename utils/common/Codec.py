@@ -0,0 +1,203 @@
+import itertools
+import json
+import struct
+from base64 import b64decode, b64encode
+
+# a codec turns the list of a message's field values into an MQTT payload and back.
+# every node has to use the same one, set by MESSAGE_CODEC at the bottom of this file.
+
+
+class JSONCodec:
+    """
+    Encodes field values as a JSON array. Bytes values are carried as base64 strings.
+    """
+
+    def encode(self, values: list) -> bytes:
+        return json.dumps(values, separators=(",", ":"), default=self._default).encode()
+
+    def decode(self, payload: bytes) -> list:
+        return json.loads(payload, object_hook=self._object_hook)
+
+    @staticmethod
+    def _default(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return {"$b": b64encode(value).decode()}
+        raise TypeError(f"Can't encode {type(value).__name__}")
+
+    @staticmethod
+    def _object_hook(value: dict):
+        if len(value) == 1 and "$b" in value:
+            return b64decode(value["$b"])
+        return value
+
+
+class BinaryCodec:
+    """
+    Encodes field values in a compact tagged binary format: one tag byte per value, ints as zigzag varints, floats as
+    big-endian doubles, and strings, bytes, lists and maps prefixed with their length as a varint. Bytes values are
+    carried as is, and the message's own list of values has no header at all. Maps of 32-bit ints to 32-bit ints, like
+    frame results, are packed as one flat array so they decode in a single unpack.
+    """
+
+    FLOAT = struct.Struct("!cd")
+    SHORT_HEADERS = {tag: [tag + bytes((n,)) for n in range(0x80)] for tag in (b"i", b"s", b"b", b"l", b"m", b"I")}
+
+    def __init__(self):
+        self.encoders = {
+            type(None): self._encode_none,
+            bool: self._encode_bool,
+            int: self._encode_int,
+            float: self._encode_float,
+            str: self._encode_str,
+            bytes: self._encode_bytes,
+            bytearray: self._encode_bytes,
+            memoryview: self._encode_bytes,
+            list: self._encode_list,
+            tuple: self._encode_list,
+            dict: self._encode_dict,
+        }
+        self.decoders = {
+            ord("N"): lambda view, offset: (None, offset),
+            ord("T"): lambda view, offset: (True, offset),
+            ord("F"): lambda view, offset: (False, offset),
+            ord("i"): self._decode_int,
+            ord("d"): lambda view, offset: (struct.unpack_from("!d", view, offset)[0], offset + 8),
+            ord("s"): self._decode_str,
+            ord("b"): self._decode_bytes,
+            ord("l"): self._decode_list,
+            ord("m"): self._decode_dict,
+            ord("I"): self._decode_int_dict,
+        }
+
+    def encode(self, values: list) -> bytes:
+        parts = []
+        for value in values:
+            self._encode(value, parts)
+        return b"".join(parts)
+
+    def decode(self, payload: bytes) -> list:
+        view = bytes(payload)
+        values = []
+        offset = 0
+        while offset < len(view):
+            value, offset = self._decode(view, offset)
+            values.append(value)
+        return values
+
+    @staticmethod
+    def _header(tag: bytes, value: int) -> bytes:
+        # a tag followed by an unsigned varint, 7 bits per byte, low bits first
+        if value < 0x80:
+            return BinaryCodec.SHORT_HEADERS[tag][value]
+        out = bytearray(tag)
+        while value >= 0x80:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+        return bytes(out)
+
+    @staticmethod
+    def _read_varint(view: bytes, offset: int) -> tuple[int, int]:
+        byte = view[offset]
+        offset += 1
+        if byte < 0x80:
+            return byte, offset
+        value = byte & 0x7F
+        shift = 7
+        while True:
+            byte = view[offset]
+            offset += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value, offset
+            shift += 7
+
+    def _encode(self, value, parts: list):
+        encoder = self.encoders.get(type(value))
+        if encoder is None:
+            raise TypeError(f"Can't encode {type(value).__name__}")
+        encoder(value, parts)
+
+    def _encode_none(self, value, parts: list):
+        parts.append(b"N")
+
+    def _encode_bool(self, value: bool, parts: list):
+        parts.append(b"T" if value else b"F")
+
+    def _encode_int(self, value: int, parts: list):
+        parts.append(self._header(b"i", value << 1 if value >= 0 else (-value << 1) - 1))  # zigzag, small either way
+
+    def _encode_float(self, value: float, parts: list):
+        parts.append(self.FLOAT.pack(b"d", value))
+
+    def _encode_str(self, value: str, parts: list):
+        data = value.encode()
+        parts.append(self._header(b"s", len(data)))
+        parts.append(data)
+
+    def _encode_bytes(self, value: bytes, parts: list):
+        parts.append(self._header(b"b", len(value)))
+        parts.append(value)
+
+    def _encode_list(self, value: list, parts: list):
+        parts.append(self._header(b"l", len(value)))
+        for item in value:
+            self._encode(item, parts)
+
+    def _encode_dict(self, value: dict, parts: list):
+        numbers = tuple(itertools.chain.from_iterable(value.items()))
+        if numbers and set(map(type, numbers)) == {int}:
+            try:
+                packed = struct.pack(f"!{len(numbers)}i", *numbers)
+            except struct.error:  # some don't fit in 32 bits
+                pass
+            else:
+                parts.append(self._header(b"I", len(value)))
+                parts.append(packed)
+                return
+        parts.append(self._header(b"m", len(value)))
+        for key, item in value.items():
+            self._encode(key, parts)
+            self._encode(item, parts)
+
+    def _decode(self, view: bytes, offset: int) -> tuple:
+        decoder = self.decoders.get(view[offset])
+        if decoder is None:
+            raise ValueError(f"Unknown tag {chr(view[offset])!r}")
+        return decoder(view, offset + 1)
+
+    def _decode_int(self, view: bytes, offset: int) -> tuple[int, int]:
+        value, offset = self._read_varint(view, offset)
+        return (value >> 1) ^ -(value & 1), offset
+
+    def _decode_str(self, view: bytes, offset: int) -> tuple[str, int]:
+        length, offset = self._read_varint(view, offset)
+        return view[offset : offset + length].decode(), offset + length
+
+    def _decode_bytes(self, view: bytes, offset: int) -> tuple[bytes, int]:
+        length, offset = self._read_varint(view, offset)
+        return view[offset : offset + length], offset + length
+
+    def _decode_list(self, view: bytes, offset: int) -> tuple[list, int]:
+        length, offset = self._read_varint(view, offset)
+        items = []
+        for _ in range(length):
+            item, offset = self._decode(view, offset)
+            items.append(item)
+        return items, offset
+
+    def _decode_dict(self, view: bytes, offset: int) -> tuple[dict, int]:
+        length, offset = self._read_varint(view, offset)
+        items = {}
+        for _ in range(length):
+            key, offset = self._decode(view, offset)
+            items[key], offset = self._decode(view, offset)
+        return items, offset
+
+    def _decode_int_dict(self, view: bytes, offset: int) -> tuple[dict, int]:
+        length, offset = self._read_varint(view, offset)
+        numbers = struct.unpack_from(f"!{2 * length}i", view, offset)
+        return dict(zip(numbers[::2], numbers[1::2])), offset + 8 * length
+
+
+MESSAGE_CODEC = BinaryCodec()  # the codec every node uses for messages
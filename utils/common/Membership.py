@@ -0,0 +1,140 @@
+import threading
+import time
+
+from paho.mqtt import client as MQTTClient
+
+from .Messages import Heartbeat
+from .Topics import HEARTBEAT_TOPIC
+
+# nodes announce their heartbeat when something in it changes, and otherwise only as a slow keepalive.
+# each node's last heartbeat is retained on its own topic, so a node that joins late sees everyone at once, and its
+# last will clears that topic so the others notice right away when it drops off.
+
+HEARTBEAT_INTERVAL = 0.1  # seconds between checks of whether a node's heartbeat changed
+KEEPALIVE_SECONDS = 1.0  # max seconds between a node's heartbeats, even if nothing changed
+MEMBER_TIMEOUT = 3 * KEEPALIVE_SECONDS  # seconds without a heartbeat before a node is dropped from the membership
+FPS_CHANGE = 0.2  # relative change in a node's throughput that is announced before the next keepalive
+
+
+def heartbeat_topic(node: str) -> str:
+    """Returns the topic a node's heartbeats are published on."""
+    return f"{HEARTBEAT_TOPIC}/{node}"
+
+
+def parse_heartbeat_topic(topic: str) -> str:
+    """Returns the node a heartbeat topic belongs to."""
+    return topic[len(HEARTBEAT_TOPIC) + 1 :]
+
+
+def set_will(client: MQTTClient.Client, node: str):
+    """
+    Has the broker clear a node's retained heartbeat if the node drops off. Has to be set before connecting.
+    """
+    client.will_set(heartbeat_topic(node), b"", qos=1, retain=True)
+
+
+class HeartbeatAnnouncer:
+    """
+    Publishes a node's heartbeat when it changes, and as a keepalive otherwise.
+    """
+
+    def __init__(self, client: MQTTClient.Client, node: str):
+        self.client = client  # mqtt client
+        self.node = node  # node the heartbeats are for
+        self.last: Heartbeat = None  # last heartbeat published
+        self.last_ts = 0.0  # when the last heartbeat was published
+
+    def changed(self, heartbeat: Heartbeat) -> bool:
+        """
+        Checks whether a heartbeat differs enough from the last one published to be announced.
+        """
+        last = self.last
+        if last is None:
+            return True
+        if (heartbeat.status, heartbeat.slots, heartbeat.queue) != (last.status, last.slots, last.queue):
+            return True
+        if heartbeat.jobs != last.jobs:  # leaders wait for this before handing the node a job's frames
+            return True
+        return abs(heartbeat.fps - last.fps) > FPS_CHANGE * max(last.fps, 1.0)
+
+    def announce(self, heartbeat: Heartbeat) -> bool:
+        """
+        Publishes a heartbeat if it changed or the keepalive is due. Returns True if it was published.
+        """
+        now = time.time()
+        if not self.changed(heartbeat) and now - self.last_ts < KEEPALIVE_SECONDS:
+            return False
+        self.client.publish(heartbeat_topic(self.node), heartbeat.encode_message(), qos=0, retain=True)
+        self.last = heartbeat
+        self.last_ts = now
+        return True
+
+
+class Member:
+    """
+    A node in the membership, and its last heartbeat.
+    """
+
+    def __init__(self, heartbeat: Heartbeat):
+        self.heartbeat = heartbeat  # last heartbeat from the node
+        self.last_seen = time.time()  # when that heartbeat arrived
+
+
+class Membership:
+    """
+    Tracks the live nodes by when each one was last heard from. A node stays a member until it goes MEMBER_TIMEOUT
+    without a heartbeat or its heartbeat topic is cleared, so the view doesn't empty out between keepalives.
+    """
+
+    def __init__(self, timeout: float = MEMBER_TIMEOUT):
+        self.timeout = timeout  # seconds without a heartbeat before a node is dropped
+        self.members: dict[str, Member] = {}  # live nodes, in the order they joined
+        self.lock = threading.Lock()  # guards members
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.members
+
+    def update(self, heartbeat: Heartbeat) -> bool:
+        """
+        Records a heartbeat. Returns True if the node just joined.
+        """
+        with self.lock:
+            joined = heartbeat.node not in self.members
+            self.members[heartbeat.node] = Member(heartbeat)
+        return joined
+
+    def remove(self, node: str) -> bool:
+        """
+        Drops a node that left. Returns True if it was a member.
+        """
+        with self.lock:
+            return self.members.pop(node, None) is not None
+
+    def expire(self) -> list[str]:
+        """
+        Drops the nodes that have gone too long without a heartbeat, and returns them.
+        """
+        now = time.time()
+        with self.lock:
+            expired = [node for node, member in self.members.items() if now - member.last_seen > self.timeout]
+            for node in expired:
+                del self.members[node]
+        return expired
+
+    def nodes(self) -> list[str]:
+        """
+        Returns the live nodes, in the order they joined.
+        """
+        with self.lock:
+            return list(self.members)
+
+    def get(self, node: str) -> Heartbeat | None:
+        """
+        Returns a node's last heartbeat, or None if it isn't a member.
+        """
+        with self.lock:
+            member = self.members.get(node)
+        return member.heartbeat if member is not None else None
@@ -1,104 +1,194 @@
-import json
+from .Codec import MESSAGE_CODEC
 
 
 class Message:
     """
     Base Message class, used for encoding/decoding over MQTT topics.
+    Subclasses list their fields in order; a message is sent as the list of its field values, through MESSAGE_CODEC.
     """
-    def __init__(self, content: dict = {}):
-        self.content = content
+    __slots__ = ()
+    fields: tuple[str, ...] = ()
 
-    def encode_message(self) -> str:
+    def values(self) -> list:
         """
-        Encodes a Munch object into a JSON string.
+        Returns the message's field values in order.
         """
-        return json.dumps(self.content)
+        return [getattr(self, field) for field in self.fields]
 
-    def __del__(self):
-        del self.content
-
-
-def message_decode(content: str) -> Message:
-    """Decodes an MQTT string into a Message."""
-    return Message(json.loads(content))
+    def encode_message(self) -> bytes:
+        """
+        Encodes the message into an MQTT payload.
+        """
+        return MESSAGE_CODEC.encode(self.values())
 
 
 class RBMessage(Message):
     """
     Message that contains fields relevant to Reliable Broadcast.
     """
-    state: str = None
-    subject: str = None
-    data: str = None
+    __slots__ = ("state", "subject", "data", "sender")
+    fields = __slots__
 
-    def __init__(self, state: str, subject: str, data: str):
-        super().__init__({})
+    def __init__(self, state: str, subject: str, data: bytes | str, sender: str = ""):
         self.state = state
         self.subject = subject
-        self.data = data
-
-        self.content["state"] = state
-        self.content["subject"] = subject
-        self.content["data"] = data
+        self.data = data  # the broadcast value, or its digest in hashed echoes and readies
+        self.sender = sender  # node that sent this message
 
     def __eq__(self, other):
-        return self.state == other.state and self.subject == other.subject and self.data == other.data
-
-    def __del__(self):
-        del self.content
+        return (
+            self.state == other.state
+            and self.subject == other.subject
+            and self.data == other.data
+            and self.sender == other.sender
+        )
 
 
-def rbmessage_decode(content: str) -> RBMessage:
-    """Decodes an MQTT string into an RBMessage."""
-    d = json.loads(content)
-    return RBMessage(d["state"], d["subject"], d["data"])
+def rbmessage_decode(content: bytes) -> RBMessage:
+    """Decodes an MQTT payload into an RBMessage."""
+    return RBMessage(*MESSAGE_CODEC.decode(content))
 
 
 class Heartbeat(Message):
     """
     Message that contains fields for node heartbeats.
     """
-    node: str
-    status: str
+    __slots__ = ("node", "status", "slots", "fps", "queue", "jobs")
+    fields = __slots__
 
-    def __init__(self, node="", status=""):
-        super().__init__({})
+    def __init__(self, node="", status="", slots=1, fps=0.0, queue=0, jobs: list[str] = None):
         self.node = node
         self.status = status
+        self.slots = slots  # number of tasks the node can hold at once
+        self.fps = fps  # measured inference throughput, in frames per second
+        self.queue = queue  # number of frames the node has yet to finish
+        self.jobs = jobs if jobs is not None else []  # jobs whose video the node has loaded and can take frames of
 
-        self.content["node"] = node
-        self.content["status"] = status
 
-    def __del__(self):
-        del self.content
+def heartbeat_decode(content: bytes) -> Heartbeat:
+    """Decodes an MQTT payload into a Heartbeat."""
+    return Heartbeat(*MESSAGE_CODEC.decode(content))
+
+
+class TransferManifest(Message):
+    """
+    Message that describes a chunked binary transfer.
+    """
+    __slots__ = ("transfer", "size", "chunk_size", "chunks", "digest")
+    fields = __slots__
+
+    def __init__(self, transfer="", size=0, chunk_size=0, chunks=0, digest=""):
+        self.transfer = transfer
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunks = chunks
+        self.digest = digest
 
 
-def heartbeat_decode(content: str) -> Heartbeat:
-    """Decodes an MQTT string into a Heartbeat."""
-    data = json.loads(content)
-    return Heartbeat(data["node"], data["status"])
+def transfermanifest_decode(content: bytes) -> TransferManifest:
+    """Decodes an MQTT payload into a TransferManifest."""
+    return TransferManifest(*MESSAGE_CODEC.decode(content))
 
 
 class VideoRequest(Message):
     """
     Message that contains fields for client video requests.
+    The video itself is sent separately as binary chunks described by the manifest.
     """
-    video: str
-    target: int
+    __slots__ = ("target", "manifest", "source", "job", "imgsz")
+    fields = __slots__
 
-    def __init__(self, video="", target=0):
-        super().__init__({})
-        self.video = video
+    def __init__(self, target=0, manifest: TransferManifest = None, source="", job="", imgsz=0):
         self.target = target
+        self.manifest = manifest if manifest is not None else TransferManifest()
+        self.source = source  # node that the video can be fetched from
+        self.job = job  # id the node the client uploaded to gave the job
+        self.imgsz = imgsz  # longest side frames are scaled down to for inference, 0 for the leader's default
+
+    def values(self) -> list:
+        return [self.target, self.manifest.values(), self.source, self.job, self.imgsz]
+
+
+def videorequest_decode(content: bytes) -> VideoRequest:
+    """Decodes an MQTT payload into a VideoRequest."""
+    target, manifest, source, job, imgsz = MESSAGE_CODEC.decode(content)
+    return VideoRequest(target, TransferManifest(*manifest), source, job, imgsz)
+
+
+class TaskCommand(Message):
+    """
+    Message that assigns a worker a shard of a job's frames, every step-th frame from start up to (not including) end.
+    """
+    __slots__ = ("start", "end", "job", "step")
+    fields = __slots__
+
+    def __init__(self, start=0, end=0, job="", step=1):
+        self.start = start
+        self.end = end
+        self.job = job
+        self.step = step  # distance between the shard's frames, above 1 while a job is sampled
+
+    def frames(self) -> range:
+        """
+        Returns the frames of the shard.
+        """
+        return range(self.start, self.end, self.step)
 
-        self.content["video"] = video
-        self.content["target"] = target
 
-    def __del__(self):
-        del self.content
+def taskcommand_decode(content: bytes) -> TaskCommand:
+    """Decodes an MQTT payload into a TaskCommand."""
+    return TaskCommand(*MESSAGE_CODEC.decode(content))
+
+
+class FrameResults(Message):
+    """
+    Message that contains a batch of frame results, as the number of hits per frame.
+    """
+    __slots__ = ("results",)
+    fields = __slots__
+
+    def __init__(self, results: dict[int, int] = None):
+        # frames come back as strings from codecs that only have string keys
+        self.results = {int(frame): hits for frame, hits in results.items()} if results is not None else {}
+
+
+def frameresults_decode(content: bytes) -> FrameResults:
+    """Decodes an MQTT payload into a FrameResults."""
+    return FrameResults(*MESSAGE_CODEC.decode(content))
+
+
+class FetchRequest(Message):
+    """
+    Message that asks a node to send a transfer it holds.
+    """
+    __slots__ = ("node", "transfer")
+    fields = __slots__
+
+    def __init__(self, node="", transfer=""):
+        self.node = node
+        self.transfer = transfer
+
+
+def fetchrequest_decode(content: bytes) -> FetchRequest:
+    """Decodes an MQTT payload into a FetchRequest."""
+    return FetchRequest(*MESSAGE_CODEC.decode(content))
+
+
+class TaskReject(Message):
+    """
+    Message that hands a shard back to the job's leader, from a node that had no room to queue it.
+    """
+    __slots__ = ("node", "job", "start", "end", "queue")
+    fields = __slots__
+
+    def __init__(self, node="", job="", start=0, end=0, queue=0):
+        self.node = node
+        self.job = job
+        self.start = start
+        self.end = end
+        self.queue = queue  # number of frames the node had yet to finish when it rejected the shard
 
 
-def videorequest_decode(content: str) -> VideoRequest:
-    """Decodes an MQTT string into a VideoRequest."""
-    data = json.loads(content)
-    return VideoRequest(data["video"], data["target"])
+def taskreject_decode(content: bytes) -> TaskReject:
+    """Decodes an MQTT payload into a TaskReject."""
+    return TaskReject(*MESSAGE_CODEC.decode(content))
@@ -1,6 +1,9 @@
 REQUEST_INBOX = "request_inbox" # a node's inbox for client requests.
 CMD_INBOX = "cmd_inbox" # a node's inbox for commands.
+CHUNK_INBOX = "chunk_inbox" # a node's inbox for binary transfer chunks.
+FETCH_INBOX = "fetch_inbox" # a node's inbox for requests to send a transfer.
+REJECT_INBOX = "reject_inbox" # a leader's inbox for shards a node had no room for.
 
 HEARTBEAT_TOPIC = "/heartbeat" # the global heartbeat topic.
-BROADCAST_TOPIC = "/broadcast" # the topic for reliable broadcast data.
+BROADCAST_TOPIC = "/broadcast" # the root of the reliable broadcast topics, /broadcast/<subject>/<phase>.
 CLIENT_TOPIC = "/client" # the client's inbox.
\ No newline at end of file
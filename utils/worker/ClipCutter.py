@@ -0,0 +1,74 @@
+import shutil
+import subprocess
+from collections.abc import Callable
+
+import cv2 as cv
+
+from .Config import CLIP_STREAM_COPY
+from .FrameStore import FrameStore
+
+DEFAULT_FPS = 30.0  # frame rate assumed for videos whose container doesn't report one
+
+
+def stream_copy(source: str, out_path: str, start_ts: float, duration: float) -> bool:
+    """
+    Cuts a clip out of a video file without re-encoding it, using ffmpeg. Without decoding, the clip can only start on
+    a keyframe, so it starts at the last keyframe at or before start_ts. Returns False if ffmpeg isn't available or
+    fails.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return False
+    command = [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-ss", f"{start_ts:.6f}", "-i", source, "-t", f"{duration:.6f}",
+        "-map", "0:v:0", "-c", "copy", "-an", "-avoid_negative_ts", "make_zero",
+        out_path,
+    ]
+    try:
+        process = subprocess.run(command, capture_output=True)
+    except OSError as e:
+        print(f"Stream copy failed: {e}")
+        return False
+    if process.returncode != 0:
+        print(f"Stream copy failed: {process.stderr.decode(errors='replace').strip()}")
+        return False
+    return True
+
+
+def encode_clip(frames: FrameStore, out_path: str, start: int, end: int, on_write: Callable[[], None] = None):
+    """
+    Re-encodes the frames from start up to (not including) end into a clip, at the video's own frame rate and
+    resolution. Frame accurate, but every frame has to be decoded and encoded again.
+    """
+    # frames scaled down for inference are decoded again at full size
+    source = frames if frames.frame_size == frames.source_size else FrameStore(frames.video, cache_size=1)
+    fourcc = cv.VideoWriter_fourcc("M", "P", "4", "V")  # Be sure to use lower case
+    rows, cols = source.frame_size
+    out = cv.VideoWriter(out_path, fourcc, source.fps or DEFAULT_FPS, (cols, rows))
+    for _, im in source.get_range(start, end):
+        out.write(im)
+        if on_write is not None:
+            on_write()
+    out.release()
+    if source is not frames:
+        source.close()
+
+
+def cut_clip(
+    source: str,
+    frames: FrameStore,
+    out_path: str,
+    start: int,
+    end: int,
+    stream: bool = CLIP_STREAM_COPY,
+    on_write: Callable[[], None] = None,
+):
+    """
+    Writes the frames from start up to (not including) end of a video to a clip. With stream set, the clip is copied
+    out of the original bitstream at keyframe boundaries, and it is only re-encoded if that isn't possible.
+    """
+    fps = frames.fps or DEFAULT_FPS
+    if stream and stream_copy(source, out_path, start / fps, (end - start) / fps):
+        return
+    encode_clip(frames, out_path, start, end, on_write)
@@ -0,0 +1,23 @@
+# contains constants for tuning how a worker splits up and processes a job.
+
+SHARD_SIZE = 30  # max number of consecutive frames the leader hands to a worker at once
+SHARD_SECONDS = 2.0  # seconds of work the leader aims to hand a worker at once, given its measured throughput
+INFERENCE_WORKERS = 1  # number of inference threads per worker, each with its own copy of the model
+WORKER_SLOTS = INFERENCE_WORKERS + 1  # number of shards a worker advertises it can hold at once, so one is prefetched
+TASK_QUEUE_SIZE = WORKER_SLOTS  # number of shards a worker queues up for inference
+FRAME_CACHE_SIZE = 64  # number of decoded frames a node keeps in memory
+FRAME_SPILL = False  # whether decoded frames are also kept in a memory-mapped file on disk
+INFERENCE_BACKEND = "pytorch"  # model format to run: "pytorch", or "onnx", "openvino" or "torchscript", exported once
+BATCH_SIZE = 8  # number of frames passed to the model in a single predict call
+IMAGE_SIZE = 640  # default longest side frames are scaled down to at decode time, and the model's input size
+WARMUP_SIZE = (IMAGE_SIZE, IMAGE_SIZE)  # size of the blank frames the model is warmed up on before taking work
+RESULT_BATCH_SIZE = SHARD_SIZE  # max number of frame results a worker gathers into one reliable broadcast
+RESULT_FLUSH_SECONDS = 0.5  # max seconds a worker holds a frame result back to gather more
+CLIP_STREAM_COPY = True  # whether the result clip is cut from the original video at keyframes instead of re-encoded
+SKIP_STEP = 1  # infer every n-th frame first and only fill in where the count changes, 1 to infer every frame
+SKIP_TOLERANCE = 0  # max difference in score between two sampled frames for the frames between them to be skipped
+TASK_TIMEOUT = 30.0  # seconds before the leader hands an unfinished shard to another node
+STRAGGLER_FACTOR = 2.0  # how many times slower than the median a node has to be to count as a straggler
+LATENCY_SMOOTHING = 0.3  # weight of the newest sample in each node's moving average latency
+BROADCAST_TIMEOUT = 60.0  # seconds before an unfinished reliable broadcast is dropped
+VIDEO_TIMEOUT = 60.0  # seconds a node waits for an accepted job's video before giving up on the job
\ No newline at end of file
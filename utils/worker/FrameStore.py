@@ -0,0 +1,128 @@
+import tempfile
+import threading
+from collections import OrderedDict
+
+import cv2 as cv
+import numpy as np
+
+from ..common.ChunkTransfer import ChunkAssembler
+from .Config import FRAME_CACHE_SIZE, FRAME_SPILL
+
+MAX_GRAB = 16  # max frames skipped by reading past them rather than seeking
+
+
+def open_capture(video: ChunkAssembler) -> cv.VideoCapture:
+    """
+    Opens a capture that decodes straight from the video's in-memory buffer, on OpenCV builds that can read from a
+    stream object, and from a file copy of the video otherwise.
+    """
+    try:
+        cap = cv.VideoCapture(video.reader(), cv.CAP_ANY, [])
+        if cap.isOpened():
+            return cap
+    except (TypeError, cv.error):
+        pass
+    return cv.VideoCapture(video.name)
+
+
+class FrameStore:
+    """
+    Gives access to the frames of a video by index, without holding the whole decoded video in memory.
+    Frames are decoded on demand from the video file, scaled down once so their longest side is at most imgsz, and
+    only the scaled frames are kept, in a bounded LRU cache. Each thread reads through its own
+    capture, so threads working on different shards don't make each other seek. With spill enabled, every decoded
+    frame is also written to a memory-mapped array on disk, so it is never decoded twice.
+    """
+
+    def __init__(
+        self, video: ChunkAssembler, cache_size: int = FRAME_CACHE_SIZE, spill: bool = FRAME_SPILL, imgsz: int = 0
+    ):
+        self.video = video  # video the frames are decoded from
+        self.imgsz = imgsz  # max longest side of the frames handed out, 0 to keep the video's resolution
+        self.cache_size = cache_size  # max number of frames kept in memory
+        self.cache: OrderedDict[int, np.ndarray] = OrderedDict()  # recently used frames, oldest first
+        self.lock = threading.Lock()  # guards the cache, the spill and the list of captures
+        self.local = threading.local()  # each thread's capture, and the index of the frame it will read next
+        self.captures: list[cv.VideoCapture] = []  # every thread's capture, kept open so sequential reads don't re-seek
+
+        cap = open_capture(video)
+        self.frame_count = int(cap.get(cv.CAP_PROP_FRAME_COUNT))
+        self.source_size = (int(cap.get(cv.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv.CAP_PROP_FRAME_WIDTH)))
+        rows, cols = self.source_size
+        scale = min(1.0, imgsz / max(rows, cols)) if imgsz > 0 and rows > 0 and cols > 0 else 1.0
+        self.frame_size = (round(rows * scale), round(cols * scale))  # size of the frames handed out
+        self.fps = cap.get(cv.CAP_PROP_FPS)  # frame rate the container reports, 0 if it doesn't
+        cap.release()
+
+        self.spill_file = None  # backing file of the spilled frames
+        self.spill: np.memmap = None  # spilled frames, indexed by frame
+        self.spilled: np.ndarray = None  # which frames have been spilled
+        if spill and self.frame_count > 0:
+            rows, cols = self.frame_size
+            self.spill_file = tempfile.NamedTemporaryFile(suffix=".frames")
+            self.spill = np.memmap(self.spill_file, dtype=np.uint8, mode="w+", shape=(self.frame_count, rows, cols, 3))
+            self.spilled = np.zeros(self.frame_count, dtype=bool)
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def get(self, index: int) -> np.ndarray | None:
+        """
+        Returns a frame by index, or None if the video has no such frame.
+        """
+        with self.lock:
+            if index in self.cache:
+                self.cache.move_to_end(index)
+                return self.cache[index]
+            if self.spill is not None and 0 <= index < self.frame_count and self.spilled[index]:
+                return self.spill[index]
+
+        if not hasattr(self.local, "cap"):
+            self.local.cap = open_capture(self.video)
+            self.local.position = 0
+            with self.lock:
+                self.captures.append(self.local.cap)
+        if 0 <= self.local.position < index <= self.local.position + MAX_GRAB:
+            # a few frames ahead, as in a sampled shard, grabbing past them is cheaper than seeking
+            while self.local.position < index and self.local.cap.grab():
+                self.local.position += 1
+        if index != self.local.position:
+            self.local.cap.set(cv.CAP_PROP_POS_FRAMES, index)
+        check, im = self.local.cap.read()
+        self.local.position = index + 1
+        if not check:
+            self.local.position = -1  # force a seek on the next read
+            return None
+        if im.shape[:2] != self.frame_size:
+            im = cv.resize(im, self.frame_size[::-1], interpolation=cv.INTER_AREA)
+
+        with self.lock:
+            if self.spill is not None and index < self.frame_count and im.shape == self.spill.shape[1:]:
+                self.spill[index] = im
+                self.spilled[index] = True
+            self.cache[index] = im
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return im
+
+    def get_range(self, start: int, end: int, step: int = 1):
+        """
+        Yields (index, frame) for every step-th frame from start up to (not including) end, stopping at the end of the
+        video.
+        """
+        for index in range(start, end, step):
+            im = self.get(index)
+            if im is None:
+                return
+            yield index, im
+
+    def close(self):
+        with self.lock:
+            for cap in self.captures:
+                cap.release()
+            self.captures.clear()
+            self.cache.clear()
+            if self.spill_file is not None:
+                del self.spill
+                self.spill = None
+                self.spill_file.close()
@@ -1,17 +1,84 @@
+import copy
+import os
+
 import cv2
+import numpy as np
 from ultralytics import YOLO
 
+from .Config import IMAGE_SIZE, INFERENCE_BACKEND
+
+# where ultralytics writes each exported format, relative to the .pt file it was exported from
+EXPORT_SUFFIXES = {"onnx": ".onnx", "openvino": "_openvino_model", "torchscript": ".torchscript"}
+EXPORT_ARGS = {"onnx": {"dynamic": True}, "openvino": {"dynamic": True}, "torchscript": {}}  # so any batch size runs
+
+
+def export_model(model: str, backend: str = INFERENCE_BACKEND) -> str:
+    """
+    Returns the path of a model exported for a backend, exporting it the first time and reusing it after that.
+    Falls back to the PyTorch model if the backend is "pytorch", unknown, or its export fails.
+    """
+    if backend == "pytorch" or model is None:
+        return model
+    if backend not in EXPORT_SUFFIXES:
+        print(f"Unknown inference backend {backend}, using pytorch")
+        return model
+
+    exported = os.path.splitext(model)[0] + EXPORT_SUFFIXES[backend]
+    if os.path.exists(exported):
+        return exported
+    try:
+        return YOLO(model).export(format=backend, **EXPORT_ARGS[backend])
+    except Exception as e:  # the backend's export dependencies may not be installed
+        print(f"Exporting {model} for {backend} failed, using pytorch: {e}")
+        return model
+
 
 class ImagePredictor:
-    def __init__(self, model: str = None):
-        self.yolo = YOLO(model) if model is not None else YOLO()
+    def __init__(self, model: str = None, yolo: YOLO = None, backend: str = INFERENCE_BACKEND):
+        if yolo is not None:
+            self.yolo = yolo
+        else:
+            model = export_model(model, backend)
+            self.yolo = YOLO(model, task="detect") if model is not None else YOLO()
+
+    def share(self) -> "ImagePredictor":
+        """
+        Returns a predictor that runs on the same loaded weights, with its own prediction state, for another thread.
+        Exported backends load their graph when they first predict, so with those each thread gets its own session.
+        """
+        yolo = copy.copy(self.yolo)  # the network module is shared, not copied
+        yolo.predictor = None
+        return ImagePredictor(yolo=yolo)
 
-    def image_predict(self, image: cv2.Mat, device: int | str = "cpu", target: int = 76) -> int:
+    def warm_up(self, size: tuple[int, int], batch: int = 1, device: int | str = "cpu"):
         """
-        Runs YOLO object detection on a frame, and returns the number of occurances of a target object.
+        Runs a batch of blank frames through the model, so setting it up isn't paid for on the first real frames.
         """
+        rows, cols = size
+        images = [np.zeros((rows, cols, 3), dtype=np.uint8) for _ in range(batch)]
+        self.image_predict_batch(images, device=device, imgsz=max(size))
 
-        result = self.yolo.predict(image, device=device, classes=[target], verbose=False)[0]
+    def image_predict(
+        self, image: cv2.Mat, device: int | str = "cpu", target: int = 76, imgsz: int = IMAGE_SIZE
+    ) -> int:
+        """
+        Runs YOLO object detection on a frame at an input size, and returns the number of occurances of a target object.
+        """
+
+        result = self.yolo.predict(image, device=device, classes=[target], imgsz=imgsz, verbose=False)[0]
         hits = len(result.boxes)
 
         return hits
+
+    def image_predict_batch(
+        self, images: list[cv2.Mat], device: int | str = "cpu", target: int = 76, imgsz: int = IMAGE_SIZE
+    ) -> list[int]:
+        """
+        Runs YOLO object detection on a batch of frames in one call at an input size, and returns the number of
+        occurances of a target object in each frame.
+        """
+
+        results = self.yolo.predict(images, device=device, classes=[target], imgsz=imgsz, verbose=False)
+        hits = [len(result.boxes) for result in results]
+
+        return hits
@@ -0,0 +1,71 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+from ..common.Messages import TaskCommand
+from .Config import BATCH_SIZE, INFERENCE_WORKERS, TASK_QUEUE_SIZE, WARMUP_SIZE
+from .ImagePredict import ImagePredictor
+
+
+class InferenceExecutor:
+    """
+    Runs tasks on a fixed pool of inference threads, and never blocks the caller when submitting one.
+    The weights are loaded once and shared by every thread, but each thread predicts through its own model instance,
+    so no two calls ever share prediction state. Every instance is warmed up before the executor is returned, so the
+    node only starts taking work once the first real frames will run at full speed.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        handler: Callable[[TaskCommand, ImagePredictor], None],
+        workers: int = INFERENCE_WORKERS,
+        queue_size: int = TASK_QUEUE_SIZE,
+    ):
+        self.model = model  # path of the model the threads run
+        self.handler = handler  # runs one task with the calling thread's model
+        self.workers = workers  # number of inference threads
+        self.tasks: queue.Queue[TaskCommand] = queue.Queue(maxsize=queue_size)  # tasks waiting for a thread
+        self.active = 0  # number of threads currently running a task
+        self.lock = threading.Lock()  # guards active
+
+        start_ts = time.time()
+        base = ImagePredictor(model)
+        predictors = [base] + [base.share() for _ in range(workers - 1)]
+        for predictor in predictors:
+            predictor.warm_up(WARMUP_SIZE, BATCH_SIZE)
+        print(f"Loaded and warmed up {workers} model instance(s) in {time.time() - start_ts:.2f} seconds")
+
+        for predictor in predictors:
+            threading.Thread(target=self._run, args=[predictor], daemon=True).start()
+
+    def submit(self, task: TaskCommand) -> bool:
+        """
+        Queues a task without blocking. Returns False if the queue is full.
+        """
+        try:
+            self.tasks.put_nowait(task)
+        except queue.Full:
+            return False
+        return True
+
+    def busy(self) -> bool:
+        """
+        Returns whether any task is running or waiting.
+        """
+        with self.lock:
+            return self.active > 0 or not self.tasks.empty()
+
+    def _run(self, predictor: ImagePredictor):
+        while True:
+            task = self.tasks.get()
+            with self.lock:
+                self.active += 1
+            try:
+                self.handler(task, predictor)
+            except Exception as e:
+                print(f"Error processing frames {task.start}-{task.end - 1}: {e}")  # the leader will reassign them
+            finally:
+                with self.lock:
+                    self.active -= 1
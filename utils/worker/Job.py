@@ -0,0 +1,52 @@
+from ..common.ChunkTransfer import ChunkAssembler
+from .FrameStore import FrameStore
+from .MaxSubarray import MaxSubarrayTree
+from .Scheduler import Scheduler
+
+
+class Job:
+    """
+    State of one client video being processed. Every node holds a Job for each video it is working on, so several
+    videos can be processed at once without their frames, results or broadcasts mixing. Only the job's leader, the node
+    the client uploaded the video to, schedules its frames.
+    """
+
+    def __init__(self, job_id: str, target: int, video: ChunkAssembler, leader: bool, imgsz: int, source: str = ""):
+        self.job_id = job_id  # id of the job, carried in its requests, broadcasts and commands
+        self.source = source  # the job's leader, which its video came from
+        self.target = target  # the target object
+        self.imgsz = imgsz  # inference size, the longest side frames are scaled down to
+        self.video = video  # the job's video
+        self.leader = leader  # whether this node is the job's leader
+
+        # only read the container's metadata, frames are decoded per shard
+        self.frames = FrameStore(video, imgsz=imgsz)  # scaled down frames of the video, decoded on demand
+        self.frame_count = len(self.frames)  # number of frames in the video
+        self.results_dict: dict[int, int] = {}  # dictionary of frame results
+        self.scores = MaxSubarrayTree(self.frame_count)  # frame scores, kept with their best window as results arrive
+        self.scheduler = Scheduler(self.frame_count) if leader else None  # hands out the frames, on the leader
+
+    def add_result(self, frame: int, hits: int, node: str = "") -> bool:
+        """
+        Records a frame's result from the node that inferred it, unless it already has one. Returns True if it was
+        recorded.
+        """
+        if frame in self.results_dict:
+            if self.scheduler is not None:
+                self.scheduler.result(frame, node=node)  # a slower copy, which frees up its node
+            return False
+        self.results_dict[frame] = hits if hits > 0 else -1
+        if 0 <= frame < self.frame_count:
+            self.scores.update(frame, self.results_dict[frame])
+        if self.scheduler is not None:
+            self.scheduler.result(frame, self.results_dict[frame], node)
+        return True
+
+    def complete(self) -> bool:
+        """
+        Checks whether every frame of the job has a result.
+        """
+        return len(self.results_dict) >= self.frame_count
+
+    def close(self):
+        self.frames.close()
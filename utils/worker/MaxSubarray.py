@@ -25,3 +25,64 @@ def max_subarray(arr: dict) -> tuple[int, int]:
             best_end = curr_end
 
     return (best_start, best_end)
+
+
+def _combine(left: tuple, right: tuple) -> tuple:
+    # each node is (total, prefix, prefix end, suffix, suffix start, best, best start, best end) of its range
+    total = left[0] + right[0]
+    prefix = (left[1], left[2]) if left[1] >= left[0] + right[1] else (left[0] + right[1], right[2])
+    suffix = (right[3], right[4]) if right[3] > right[0] + left[3] else (right[0] + left[3], left[4])
+    best = (left[5], left[6], left[7])
+    if left[3] + right[1] > best[0]:
+        best = (left[3] + right[1], left[4], right[2])
+    if right[5] > best[0]:
+        best = (right[5], right[6], right[7])
+    return (total, *prefix, *suffix, *best)
+
+
+class MaxSubarrayTree:
+    """
+    Keeps the maximum subarray of a fixed number of scores while they change, as a segment tree over the scores.
+    Setting a score takes O(log n), and the best window so far can be read at any time. Scores that were never set
+    count as 0.
+    """
+
+    def __init__(self, length: int):
+        self.length = length  # number of scores
+        self.size = 1  # number of leaves, a power of two
+        while self.size < max(length, 1):
+            self.size *= 2
+        # padding leaves past the end can't be part of any window
+        pad = (float("-inf"), float("-inf"), -1, float("-inf"), -1, float("-inf"), -1, -1)
+        self.tree = [pad] * (2 * self.size)
+        for index in range(length):
+            self.tree[self.size + index] = (0, 0, index, 0, index, 0, index, index)
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = _combine(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def __len__(self) -> int:
+        return self.length
+
+    def update(self, index: int, score: int):
+        """
+        Sets the score at an index.
+        """
+        node = self.size + index
+        self.tree[node] = (score, score, index, score, index, score, index, index)
+        node //= 2
+        while node:
+            self.tree[node] = _combine(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def best(self) -> tuple[int, int]:
+        """
+        Returns the starting and ending index (inclusive) of the maximum subarray so far, like max_subarray.
+        """
+        root = self.tree[1]
+        return (max(root[6], 0), max(root[7], 0))
+
+    def best_sum(self) -> int:
+        """
+        Returns the sum of the maximum subarray so far.
+        """
+        return self.tree[1][5]
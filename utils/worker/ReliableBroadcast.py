@@ -1,4 +1,5 @@
 import json  # noqa
+import time
 
 from munch import Munch, munchify  # noqa
 from paho.mqtt import client as MQTTClient
@@ -8,78 +9,116 @@ from ..common.Messages import RBMessage, rbmessage_decode  # noqa
 from ..common.Topics import BROADCAST_TOPIC
 
 
+def broadcast_topic(subject: str, phase: str) -> str:
+    """Returns the topic a reliable broadcast message is published on."""
+    return f"{BROADCAST_TOPIC}/{subject}/{phase}"
+
+
+def parse_broadcast_topic(topic: str) -> tuple[str, str]:
+    """Splits a reliable broadcast topic into its subject and phase, without touching the payload."""
+    subject, _, phase = topic[len(BROADCAST_TOPIC) + 1 :].rpartition("/")
+    return subject, phase
+
+
 class RBInstance:
-    def __init__(self, client: MQTTClient.Client, nodes: list[str], initial_message: RBMessage, use_hash : bool = False):
+    """
+    One run of Bracha's reliable broadcast for a subject.
+    Each sender's echo and ready are counted once, and this node sends its own echo and ready at most once each,
+    so a broadcast costs every node exactly one echo and one ready. An instance can be created by any message of the
+    run, since a node that missed the initial message still has to help the others finish.
+    """
+
+    def __init__(self, client: MQTTClient.Client, nodes: list[str], subject: str, node: str, use_hash: bool = False):
         self.client = client  # mqtt client
         self.nodes = nodes  # list of nodes in network
-        self.initial_message = initial_message  # the initial message/state of the RB protocol
-        self.subject = initial_message.subject  # the subject of the message
-        self.echo_messages: list[RBMessage] = []
-        self.ready_messages: list[RBMessage] = []
-        self.use_hash = use_hash
+        self.subject = subject  # the subject of the message
+        self.node = node  # name of this node, stamped on everything it sends
+        self.initial_message: RBMessage = None  # the initial message/state of the RB protocol, once received
+        self.use_hash = use_hash  # agree on the sha256 digest of the data instead of the data itself
         self.hash_value = None
-        
-        if self.use_hash:
-            self.hash_value = sha256(initial_message.data.encode()).hexdigest()
+        self.created_ts = time.time()  # when this instance started, for garbage collection
 
-        # send out your initial contents as an echo
-        if self.use_hash:
-            echo_message = RBMessage("echo", self.subject, str(self.hash_value))
-        else:
-            echo_message = RBMessage("echo", self.subject, initial_message.data)
-        self.send_all(echo_message)
+        self.echo_votes: dict[str, set[str]] = {}  # senders of the echoes received, per value
+        self.ready_votes: dict[str, set[str]] = {}  # senders of the readies received, per value
+        self.echo_senders: set[str] = set()  # nodes whose echo has been counted
+        self.ready_senders: set[str] = set()  # nodes whose ready has been counted
+        self.echoed = False  # whether this node has sent its echo
+        self.readied = False  # whether this node has sent its ready
+        self.agreed: str = None  # the value 2f + 1 readies agreed on
+        self.accepted = False  # whether this node has accepted the broadcast
 
     def send_all(self, message: RBMessage):
         """
         Sends a RBMessage to all nodes.
         """
-        self.client.publish(f"{BROADCAST_TOPIC}", message.encode_message())
+        self.client.publish(broadcast_topic(self.subject, message.state), message.encode_message())
 
-    def count_alike_messages(self, messages: list[RBMessage]) -> tuple[int, RBMessage]:
+    def count_vote(self, votes: dict[str, set[str]], senders: set[str], message: RBMessage) -> int:
         """
-        Tallies up a list of RBMessages and returns the most common value, and its count.
+        Counts an RBMessage towards its value, once per sender, and returns that value's number of votes.
+        A sender's later messages in the same phase are ignored, even if they carry a different value.
         """
-        contents: dict = {}
-
-        for message in messages:
-            if message.data not in contents:
-                contents[message.data] = 0
-            contents[message.data] += 1
-
-        max_data = None
-        max_count = 0
-        for key in contents:
-            if contents[key] > max_count:
-                max_data = key
-                max_count = contents[key]
-
-        return max_count, max_data
+        if message.sender in senders:
+            return 0
+        senders.add(message.sender)
+        votes.setdefault(message.data, set()).add(message.sender)
+        return len(votes[message.data])
 
     def handle_message(self, message: RBMessage) -> RBMessage | None:
+        """
+        Advances the protocol with a message, and returns the accepted message once the broadcast completes.
+        """
         n = len(self.nodes)
         f = (n - 1) // 3
-        if message.state == "echo":
-            self.echo_messages.append(message)
-            max_count, max_data = self.count_alike_messages(self.echo_messages)
+        if message.state == "initial":
+            if self.initial_message is not None:
+                return None
+            self.initial_message = message
+            if self.use_hash:
+                data = message.data.encode() if isinstance(message.data, str) else message.data
+                self.hash_value = sha256(data).hexdigest()
+
+            # send out your initial contents as an echo
+            if not self.echoed:
+                self.echoed = True
+                self.send_all(RBMessage("echo", self.subject, self.hash_value if self.use_hash else message.data, self.node))
+
+        elif message.state == "echo":
+            count = self.count_vote(self.echo_votes, self.echo_senders, message)
 
-            if max_count >= (n + f) // 2:
-                if self.use_hash:
-                    ready_message = RBMessage("ready", self.initial_message.subject, sha256(max_data.encode()).hexdigest())
-                else:
-                    ready_message = RBMessage("ready", self.initial_message.subject, max_data)
-                self.send_all(ready_message)
+            if count >= (n + f) // 2 + 1:
+                self.send_ready(message.data)
 
         elif message.state == "ready":
-            self.ready_messages.append(message)
-            max_count, max_data = self.count_alike_messages(self.ready_messages)
-
-            if max_count >= (2 * f + 1):
-                if self.use_hash:
-                    accept_message = RBMessage("accepted", self.initial_message.subject, self.initial_message.data)
-                    return accept_message
-                else:
-                    accept_message = RBMessage("accepted", self.initial_message.subject, max_data)
-                    return accept_message
+            count = self.count_vote(self.ready_votes, self.ready_senders, message)
+
+            if count >= f + 1:  # enough readies that at least one came from a correct node
+                self.send_ready(message.data)
+            if count >= 2 * f + 1 and self.agreed is None:
+                self.agreed = message.data
+
+        return self.accept()
+
+    def send_ready(self, data: str):
+        if not self.readied:
+            self.readied = True
+            self.send_all(RBMessage("ready", self.subject, data, self.node))
+
+    def accept(self) -> RBMessage | None:
+        """
+        Returns the accepted message the first time both the agreed value and the data it stands for are known.
+        """
+        if self.accepted or self.agreed is None:
+            return None
+        if self.use_hash:
+            # only the digest was agreed on, so our own copy of the data has to match it
+            if self.initial_message is None or self.agreed != self.hash_value:
+                return None
+            data = self.initial_message.data
+        else:
+            data = self.agreed
+        self.accepted = True
+        return RBMessage("accepted", self.subject, data, self.node)
 
     def __eq__(self, other):
         return self.subject == other.subject
@@ -0,0 +1,360 @@
+import heapq
+import itertools
+import statistics
+import threading
+import time
+from collections import deque
+
+from ..common.Membership import MEMBER_TIMEOUT
+from .Config import (
+    LATENCY_SMOOTHING,
+    SHARD_SECONDS,
+    SHARD_SIZE,
+    SKIP_STEP,
+    SKIP_TOLERANCE,
+    STRAGGLER_FACTOR,
+    TASK_TIMEOUT,
+)
+from .MaxSubarray import MaxSubarrayTree
+
+
+class Shard:
+    """
+    A range of frames handed to one node, every step-th frame from start up to (not including) end.
+    """
+
+    def __init__(self, node: str, start: int, end: int, deadline: float, remaining: set[int], step: int = 1):
+        self.node = node  # node processing the shard
+        self.start = start  # first frame of the shard
+        self.end = end  # frame after the last frame of the shard
+        self.step = step  # distance between the shard's frames
+        self.size = len(range(start, end, step))  # number of frames in the shard
+        self.assigned_ts = time.time()  # when the shard was handed out
+        self.deadline = deadline  # when the shard is handed to another node
+        self.remaining = remaining  # frames without an accepted result yet
+        self.unreported = set(remaining)  # frames the node hasn't sent a result for yet, from any copy or none
+
+
+class NodeCapacity:
+    """
+    What a node advertises about itself in its heartbeats.
+    """
+
+    def __init__(self, slots: int, fps: float, queue: int):
+        self.slots = slots  # number of shards the node can hold at once
+        self.fps = fps  # measured inference throughput, in frames per second
+        self.queue = queue  # number of frames the node has yet to finish
+        self.last_seen = time.time()  # when the node's last heartbeat arrived
+        self.full_at: int = None  # queue the node last rejected a shard at, it gets no work until its queue drops below
+
+
+class Scheduler:
+    """
+    Hands out shards of a job's frames to nodes with open slots. Pending frames wait in a deque, assigned shards are
+    tracked with a deadline so a lost shard gets handed out again, and the leader sleeps on a condition variable until a
+    slot opens up, a result arrives or a deadline passes.
+
+    Nodes advertise their slots and measured throughput in their heartbeats. Each shard is sized to about SHARD_SECONDS
+    of work for the node it goes to, so faster nodes get proportionally more frames at a time.
+
+    Each node's per-frame latency is tracked as a moving average, from the shards it reports in full. Once nothing is
+    left pending, idle nodes are given speculative copies of the in-flight shards expected to finish last (stragglers'
+    first), and whichever copy's results are accepted first win. The losing copy keeps its node's slot until that node
+    reports it too or its deadline passes, since the node is still working on it.
+
+    With a step above 1, only every step-th frame (and the last) is handed out at first. Once both ends of a run of
+    skipped frames have a score, the run is either assumed to score the same as its start, if the ends are within the
+    tolerance of each other, or handed out in full. Before finishing, skipped frames within a step of the edges of the
+    best window so far are handed out as well, since the window is only as good as its edges. Runs of evenly spaced
+    frames go out as one strided shard, so sampling doesn't fall back to a command per frame.
+    """
+
+    def __init__(
+        self,
+        frame_count: int,
+        shard_size: int = SHARD_SIZE,
+        task_timeout: float = TASK_TIMEOUT,
+        step: int = SKIP_STEP,
+        tolerance: int = SKIP_TOLERANCE,
+    ):
+        self.frame_count = frame_count  # number of frames in the job
+        self.shard_size = shard_size  # max number of frames per assignment
+        self.task_timeout = task_timeout  # seconds before an unfinished shard is handed out again
+        self.step = max(1, step)  # distance between the frames sampled first
+        self.tolerance = tolerance  # max score difference across a run of frames that is skipped
+
+        samples = list(range(0, frame_count, self.step))
+        if samples and samples[-1] != frame_count - 1:
+            samples.append(frame_count - 1)
+        self.pending: deque[int] = deque(samples)  # frames waiting to be assigned, mostly in order
+        self.gaps: dict[int, int] = {a: b for a, b in zip(samples, samples[1:]) if b - a > 1}  # unsampled runs, a to b
+        self.gap_ends: dict[int, int] = {b: a for a, b in self.gaps.items()}  # the same runs, by their end
+        self.scores: dict[int, int] = {}  # scores of the frames with a result, while runs are still open
+        self.skipped: dict[int, int] = {}  # frames that are not inferred, and the score they are assumed to have
+        self.estimate = MaxSubarrayTree(frame_count)  # scores with the skipped frames filled in
+        self.frame_shards: dict[int, list[Shard]] = {}  # in-flight frames, and the shards they are part of
+        self.deadlines: list[tuple[float, int, Shard]] = []  # heap of (deadline, tiebreak, shard) of assigned shards
+        self.tiebreak = itertools.count()  # keeps heap entries with equal deadlines comparable
+        self.done: set[int] = set()  # frames with an accepted result
+        self.capacity: dict[str, NodeCapacity] = {}  # advertised capacity per node
+        self.node_shards: dict[str, list[Shard]] = {}  # shards each node is still working on, one slot each
+        self.latency: dict[str, float] = {}  # moving average of seconds per frame, per node
+        self.cond = threading.Condition()  # signals nodes freeing up and results arriving
+
+    def update_node(self, node: str, slots: int, fps: float, queue: int):
+        """
+        Records the capacity a node advertised in a heartbeat.
+        """
+        with self.cond:
+            previous = self.capacity.get(node)
+            capacity = NodeCapacity(slots, fps, queue)
+            if previous is not None and previous.full_at is not None and queue > 0 and queue >= previous.full_at:
+                capacity.full_at = previous.full_at  # still full, nothing has left its queue since
+            self.capacity[node] = capacity
+            # only wake the leader when this may have opened up a slot
+            if (
+                previous is None
+                or slots > previous.slots
+                or queue < previous.queue
+                or time.time() - previous.last_seen > MEMBER_TIMEOUT
+            ):
+                self.cond.notify()
+
+    def remove_node(self, node: str):
+        """
+        Forgets a node that left, and hands its unfinished shards out again without waiting for their deadlines.
+        """
+        with self.cond:
+            self.capacity.pop(node, None)
+            now = time.time()
+            for _, _, shard in list(self.deadlines):
+                if shard.node == node:
+                    heapq.heappush(self.deadlines, (now, next(self.tiebreak), shard))
+            self.cond.notify()
+
+    def reject(self, node: str, start: int, end: int, queue: int = 0):
+        """
+        Hands a shard a node had no room for out again right away, and holds off on the node until a heartbeat shows
+        its queue below where it was when it rejected. Unlike a missed deadline, this says nothing about the node's
+        speed.
+        """
+        with self.cond:
+            capacity = self.capacity.get(node)
+            if capacity is not None:
+                capacity.full_at = queue
+            for _, _, shard in self.deadlines:
+                if shard.node == node and shard.start == start and shard.end == end and shard.remaining:
+                    self._requeue(shard)
+            self.cond.notify()
+
+    def result(self, frame: int, score: int = 0, node: str = ""):
+        """
+        Records a node's result for a frame, and its score. Only the first result for a frame counts, later ones from
+        slower copies just free up their node once it has reported its whole shard.
+        """
+        with self.cond:
+            if not 0 <= frame < self.frame_count:
+                return
+            if frame not in self.done:
+                self.done.add(frame)
+                self.skipped.pop(frame, None)
+                if self.step > 1:
+                    self.estimate.update(frame, score)
+                    self.scores[frame] = score
+                    if frame in self.gaps:
+                        self._close_gap(frame, self.gaps[frame])
+                    if frame in self.gap_ends:
+                        self._close_gap(self.gap_ends[frame], frame)
+                for shard in self.frame_shards.pop(frame, []):
+                    shard.remaining.discard(frame)
+            for shard in list(self.node_shards.get(node, [])):
+                if frame in shard.unreported:
+                    shard.unreported.discard(frame)
+                    if not shard.unreported:  # only the node's own shards tell how fast it is
+                        self._release(shard)
+                        self._observe(node, (time.time() - shard.assigned_ts) / shard.size)
+            self.cond.notify()
+
+    def stragglers(self) -> set[str]:
+        """
+        Returns the nodes whose per-frame latency is well above the cluster's median.
+        """
+        with self.cond:
+            if len(self.latency) < 2:
+                return set()
+            median = statistics.median(self.latency.values())
+            return {node for node, latency in self.latency.items() if latency > STRAGGLER_FACTOR * median}
+
+    def next_assignment(self) -> tuple[str, int, int, int] | None:
+        """
+        Blocks until a node with an open slot and pending (or speculative) work are both available, and returns
+        (node, start, end, step) of the shard to send it, with end exclusive. Returns None once every frame has a
+        result.
+        """
+        with self.cond:
+            while True:
+                if not self.pending and not self.frame_shards and self.skipped:
+                    self._refine_edges()
+                if len(self.done) + len(self.skipped) == self.frame_count:
+                    return None
+                self._expire()
+                while self.pending and self.pending[0] in self.done:  # finished by a late result
+                    self.pending.popleft()
+                if self.pending:
+                    node = self._open_node()
+                    if node is not None:
+                        return self._assign(node)
+                else:
+                    assignment = self._speculate()
+                    if assignment is not None:
+                        return assignment
+
+                timeout = self.deadlines[0][0] - time.time() if self.deadlines else None
+                self.cond.wait(timeout)
+
+    def skipped_frames(self) -> dict[int, int]:
+        """
+        Returns the frames that were never inferred, and the score each was assumed to have.
+        """
+        with self.cond:
+            return dict(self.skipped)
+
+    def _close_gap(self, start: int, end: int):
+        # once both ends of a run of unsampled frames have a score, skip the run or hand it out in full
+        if start not in self.scores or end not in self.scores:
+            return
+        del self.gaps[start]
+        del self.gap_ends[end]
+        if abs(self.scores[start] - self.scores[end]) <= self.tolerance:
+            for frame in range(start + 1, end):
+                if frame not in self.done:
+                    self.skipped[frame] = self.scores[start]
+                    self.estimate.update(frame, self.scores[start])
+        else:
+            self.pending.extendleft(reversed([frame for frame in range(start + 1, end) if frame not in self.done]))
+            self.cond.notify()
+
+    def _refine_edges(self):
+        # hand out the skipped frames around the edges of the best window so far
+        start, end = self.estimate.best()
+        edges = [frame for frame in self.skipped if abs(frame - start) <= self.step or abs(frame - end) <= self.step]
+        for frame in edges:
+            del self.skipped[frame]
+        self.pending.extend(sorted(edges))
+
+    def _observe(self, node: str, latency: float):
+        if node in self.latency:
+            latency = LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency[node]
+        self.latency[node] = latency
+
+    def _fps(self, node: str) -> float:
+        # advertised throughput, or the one measured from the node's shards if it hasn't measured one yet
+        fps = self.capacity[node].fps
+        if fps <= 0 and self.latency.get(node, 0) > 0:
+            fps = 1 / self.latency[node]
+        return fps
+
+    def _shard_length(self, node: str) -> int:
+        fps = self._fps(node)
+        if fps <= 0:
+            return self.shard_size
+        return max(1, min(self.shard_size, round(fps * SHARD_SECONDS)))
+
+    def _open_node(self) -> str | None:
+        # the live node with the most open slots, fastest first
+        now = time.time()
+        best = None
+        best_key = None
+        for node, capacity in self.capacity.items():
+            if now - capacity.last_seen > MEMBER_TIMEOUT or capacity.full_at is not None:
+                continue
+            open_slots = capacity.slots - len(self.node_shards.get(node, []))
+            if open_slots <= 0 or capacity.queue >= capacity.slots * self._shard_length(node):
+                continue
+            key = (open_slots / capacity.slots, self._fps(node))
+            if best_key is None or key > best_key:
+                best = node
+                best_key = key
+        return best
+
+    def _start(self, node: str, start: int, end: int, step: int = 1) -> tuple[str, int, int, int]:
+        remaining = {frame for frame in range(start, end, step) if frame not in self.done}
+        shard = Shard(node, start, end, time.time() + self.task_timeout, remaining, step)
+        for frame in remaining:
+            self.frame_shards.setdefault(frame, []).append(shard)
+        self.node_shards.setdefault(node, []).append(shard)
+        heapq.heappush(self.deadlines, (shard.deadline, next(self.tiebreak), shard))
+        return node, start, end, step
+
+    def _assign(self, node: str) -> tuple[str, int, int, int]:
+        # the longest run of evenly spaced pending frames, consecutive ones or sampled ones a step apart
+        length = self._shard_length(node)
+        start = self.pending.popleft()
+        step = self.pending[0] - start if self.pending and 0 < self.pending[0] - start <= self.step else 1
+        last = start
+        count = 1
+        while self.pending and self.pending[0] == last + step and last + step not in self.done and count < length:
+            last = self.pending.popleft()
+            count += 1
+        return self._start(node, start, last + 1, step)
+
+    def _speculate(self) -> tuple[str, int, int, int] | None:
+        # re-issue the in-flight shard expected to finish last, to an idle node expected to finish it sooner
+        now = time.time()
+        stragglers = self.stragglers()
+        best = None
+        best_key = None
+        for _, _, shard in self.deadlines:
+            # only shards that are still the sole copy of their frames
+            if not shard.remaining or any(len(self.frame_shards[frame]) > 1 for frame in shard.remaining):
+                continue
+            latency = self.latency.get(shard.node)
+            finish = shard.deadline if latency is None else shard.assigned_ts + latency * shard.size
+            key = (shard.node in stragglers, finish)
+            if best_key is None or key > best_key:
+                best = shard
+                best_key = key
+        if best is None:
+            return None
+
+        for node, capacity in self.capacity.items():
+            # only idle, live nodes
+            if node == best.node or self.node_shards.get(node) or now - capacity.last_seen > MEMBER_TIMEOUT:
+                continue
+            if capacity.full_at is not None:
+                continue
+            latency = self.latency.get(node)
+            if latency is not None and now + latency * len(best.remaining) >= best_key[1] and not best_key[0]:
+                continue
+            print(f" speculatively re-issuing frames {min(best.remaining)}-{max(best.remaining)} of {best.node}")
+            return self._start(node, min(best.remaining), max(best.remaining) + 1, best.step)
+        return None
+
+    def _expire(self):
+        # put the unfinished frames of overdue shards back at the front of the queue
+        now = time.time()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, _, shard = heapq.heappop(self.deadlines)
+            if not shard.remaining:
+                self._release(shard)  # another copy won, and this one never reported back
+                continue
+            self._observe(shard.node, self.task_timeout / shard.size)
+            self._requeue(shard)
+
+    def _requeue(self, shard: Shard):
+        # put a shard's unfinished frames back at the front of the queue, unless another copy is still running
+        expired = []
+        for frame in sorted(shard.remaining):
+            self.frame_shards[frame].remove(shard)
+            if not self.frame_shards[frame]:  # no speculative copy still running
+                del self.frame_shards[frame]
+                expired.append(frame)
+        shard.remaining.clear()
+        self._release(shard)
+        self.pending.extendleft(reversed(expired))
+
+    def _release(self, shard: Shard):
+        # free the slot a shard holds on its node, if it still holds one
+        shards = self.node_shards.get(shard.node, [])
+        if shard in shards:
+            shards.remove(shard)
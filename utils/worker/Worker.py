@@ -1,53 +1,115 @@
+import itertools
+import queue
 import secrets
 import tempfile
 import threading
 import time
-from base64 import b64decode, b64encode
-from copy import deepcopy
 
-import cv2 as cv
 import numpy as np  # noqa
 from paho.mqtt import client as MQTT
 
+from ..common.ChunkTransfer import ChunkAssembler, ChunkStreamer, chunk_decode, send_chunks
+from ..common.Membership import (
+    HEARTBEAT_INTERVAL,
+    HeartbeatAnnouncer,
+    Membership,
+    heartbeat_topic,
+    parse_heartbeat_topic,
+    set_will,
+)
 from ..common.Messages import (
+    FetchRequest,
+    FrameResults,
     Heartbeat,
     RBMessage,
+    TaskCommand,
+    TaskReject,
     VideoRequest,
+    fetchrequest_decode,
+    frameresults_decode,
     heartbeat_decode,
     rbmessage_decode,
+    taskcommand_decode,
+    taskreject_decode,
     videorequest_decode,
 )
 from ..common.MQTT_Broker import MQTT_HOST, MQTT_PORT
-from ..common.Topics import HEARTBEAT_TOPIC, BROADCAST_TOPIC, CMD_INBOX, REQUEST_INBOX, CLIENT_TOPIC
+from ..common.Topics import (
+    HEARTBEAT_TOPIC,
+    BROADCAST_TOPIC,
+    CMD_INBOX,
+    REQUEST_INBOX,
+    CHUNK_INBOX,
+    FETCH_INBOX,
+    REJECT_INBOX,
+    CLIENT_TOPIC,
+)
+from .ClipCutter import cut_clip
+from .Config import (
+    BATCH_SIZE,
+    BROADCAST_TIMEOUT,
+    IMAGE_SIZE,
+    INFERENCE_WORKERS,
+    LATENCY_SMOOTHING,
+    RESULT_BATCH_SIZE,
+    RESULT_FLUSH_SECONDS,
+    VIDEO_TIMEOUT,
+    WORKER_SLOTS,
+)
 from .ImagePredict import ImagePredictor
-from .MaxSubarray import max_subarray
-from .ReliableBroadcast import RBInstance
+from .InferenceExecutor import InferenceExecutor
+from .Job import Job
+from .ReliableBroadcast import RBInstance, broadcast_topic, parse_broadcast_topic
+
+REQUEST_SUBJECT = "client"  # prefix of the subjects of client request broadcasts, client/<job>
+RESULTS_SUBJECT = "results"  # prefix of the subjects of frame result broadcasts, results/<job>/<node>/<n>
+
+
+def subject_job(subject: str) -> str:
+    """Returns the job a request or result broadcast subject belongs to."""
+    return subject.split("/")[1]
+
+
+def subject_node(subject: str) -> str:
+    """Returns the node that inferred the frames of a result broadcast subject."""
+    return subject.split("/")[2]
 
 
 class Worker:
     client: MQTT.Client  # mqtt client
     client_name: str  # client's unique name
-    leader = False  # whether this node is the leader
-    busy = False  # whether this node is processing a task
-
-    nodes: dict = {}  # nodes and their statuses
-    node_ping: dict = {}  # intermediate dict before the main one
-    broadcast_queue: list[RBInstance] = []  # queue of pending reliable broadcasts
-    image_dict: dict = {} # dictionary of video frames
-    results_dict: dict = {} # dictionary of frame results
-    processing_queue: list[int] = [] # list of frames currently being processed
-    predictor: ImagePredictor # the YOLO image processor
-    free_nodes: list[str] = [] # list of nodes that are not busy
-    target: int = 0 # the target object
+
+    membership: Membership  # live nodes and their last heartbeats
+    broadcasts: dict[str, RBInstance] = {}  # pending reliable broadcasts, by subject
+    finished_broadcasts: dict[str, float] = {}  # when recently accepted broadcasts finished, by subject
+    jobs: dict[str, Job] = {} # jobs this node is working on, by job id
+    early_results: dict[str, dict[int, int]] = {} # results of accepted jobs still waiting on their video, by job id
+    held_tasks: dict[str, list[TaskCommand]] = {} # tasks of accepted jobs still waiting on their video, by job id
+    executor: InferenceExecutor # runs tasks from the leaders on the inference threads
     processing_time : float = 0 # total time spent processing frames
+    fps: float = 0.0 # moving average of one inference thread's throughput, in frames per second
+    queued_frames: int = 0 # number of assigned frames this node has yet to finish
+    queue_lock: threading.Lock # guards queued_frames
+    result_queue: queue.Queue # batches of frame results waiting to be broadcast
+    result_batches = itertools.count() # numbers this node's result broadcasts
     bytes_in_total : int = 0
+    transfers: dict[str, ChunkAssembler] = {} # chunked video transfers being assembled, by transfer id
+    client_requests: dict[str, VideoRequest] = {} # client requests waiting on their upload, by transfer id
+    pending_videos: dict[str, VideoRequest] = {} # accepted requests waiting on their video, by transfer id
+    pending_ts: dict[str, float] = {} # when each accepted request started waiting on its video, by transfer id
+    video: ChunkAssembler = None # the video of the last finished job, kept in case the next job is the same video
 
     def __init__(self):
         self.client_name = secrets.token_urlsafe(8)  # set client name as random string
         self.client = MQTT.Client(MQTT.CallbackAPIVersion.VERSION2, client_id=self.client_name)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
-        self.predictor = ImagePredictor(f"{__file__.replace('Worker.py', 'yolo12n.pt')}")
+        set_will(self.client, self.client_name)
+        self.membership = Membership()
+        self.queue_lock = threading.Lock()
+        self.result_queue = queue.Queue()
+        # loads and warms up the model before connecting, so other nodes only see this one once it is ready
+        self.executor = InferenceExecutor(f"{__file__.replace('Worker.py', 'yolo12n.pt')}", self.command_cb)
 
         # wait for MQTT connection
         while not self.client.is_connected():
@@ -61,157 +123,406 @@ class Worker:
         print(f"Connected as {self.client_name}")
 
         threading.Thread(target=self.heartbeat_timeout_loop, daemon=True).start()  # start heartbeat
+        threading.Thread(target=self.result_loop, daemon=True).start()  # broadcast results as they come
 
+        announcer = HeartbeatAnnouncer(self.client, self.client_name)
         while self.client.is_connected():
-            hb_message = Heartbeat(node=self.client_name, status="free" if not self.busy else "busy")
-            self.client.publish(f"{HEARTBEAT_TOPIC}", hb_message.encode_message())
+            hb_message = Heartbeat(
+                node=self.client_name,
+                status="free" if not self.executor.busy() else "busy",
+                slots=WORKER_SLOTS,
+                fps=round(self.fps * INFERENCE_WORKERS, 2),  # threads run side by side
+                queue=self.queued_frames,
+                jobs=list(self.jobs),
+            )
+            announcer.announce(hb_message)  # only when something changed, or as a keepalive
             del hb_message
-            time.sleep(0.1)
+            time.sleep(HEARTBEAT_INTERVAL)
 
-    # tracks nodes' heartbeats.
+    # drops nodes that stopped sending heartbeats.
     def heartbeat_timeout_loop(self):
         while True:
-            self.nodes = deepcopy(self.node_ping)
-            self.node_ping = {}
+            for node in self.membership.expire():
+                print(f"{node} timed out")
+                self.node_left(node)
+            self.collect_broadcasts()
+            for transfer, pending_ts in list(self.pending_ts.items()):
+                if time.time() - pending_ts > VIDEO_TIMEOUT:
+                    self.abandon_video(transfer)
             time.sleep(0.5)
 
-    def leader_loop(self):
+    # drops broadcasts that never finished, and forgets finished ones once their stragglers have gone by.
+    def collect_broadcasts(self):
+        now = time.time()
+        for subject, rb in list(self.broadcasts.items()):
+            if now - rb.created_ts > BROADCAST_TIMEOUT:
+                self.broadcasts.pop(subject, None)
+        for subject, finished_ts in list(self.finished_broadcasts.items()):
+            if now - finished_ts > BROADCAST_TIMEOUT:
+                self.finished_broadcasts.pop(subject, None)
+
+    # schedules a job this node leads, and sends the result back to the client.
+    def leader_loop(self, job: Job):
         # distribute tasks to open nodes
-        while len(self.results_dict) != len(self.image_dict):
-            for node in self.free_nodes:
-                task_id = -1
-                for i in self.image_dict:
-                    if i not in self.processing_queue and i not in self.results_dict:
-                        task_id = i
-                        break
-
-                if task_id != -1:
-                    self.client.publish(f"/{node}/{CMD_INBOX}", task_id)
-                    self.processing_queue.append(task_id)
-                    print(f" {node} is processing frame {task_id}")
-                    self.free_nodes.remove(node)
-                else:
-                    self.processing_queue = []
+        assignment = job.scheduler.next_assignment()
+        while assignment is not None:
+            node, start, end, step = assignment
+            task = TaskCommand(start, end, job.job_id, step)
+            self.client.publish(f"/{node}/{CMD_INBOX}", task.encode_message())
+            print(f" {node} is processing frames {start}-{end - 1} of job {job.job_id}")
+            assignment = job.scheduler.next_assignment()
 
-            time.sleep(0.01)
+        # share the scores assumed for the frames that were skipped, so every node sees the job finish
+        skipped = job.scheduler.skipped_frames()
+        if skipped:
+            print(f"Skipped {len(skipped)} of {job.frame_count} frames of job {job.job_id}")
+            for frame_id, score in skipped.items():
+                job.add_result(frame_id, score)
+            self.result_queue.put((job.job_id, skipped))
 
         # return the results to the client
-        print(self.results_dict)
-        start_frame, end_frame = max_subarray(dict(sorted(self.results_dict.items())))
-        fourcc = cv.VideoWriter_fourcc("M", "P", "4", "V")  # Be sure to use lower case
+        start_frame, end_frame = job.scores.best()
+        end_frame += 1  # best() includes its last frame
+        print(f"Best window of job {job.job_id}: frames {start_frame}-{end_frame - 1}, score {job.scores.best_sum()}")
         tf = tempfile.NamedTemporaryFile(suffix=".mp4")
-        rows, cols, _ = self.image_dict[0].shape
-        out = cv.VideoWriter(tf.name, fourcc, 30.0, (cols, rows))
-        for frame in range(start_frame, end_frame):
-            out.write(self.image_dict[frame])
-        out.release()
-
-        clip = ""
-        with open(tf.name, "rb") as f:
-            clip = f.read()
+        # send the clip to the client in chunks as it is written, and its manifest once it is done
+        streamer = ChunkStreamer(self.client, f"{CLIENT_TOPIC}/{CHUNK_INBOX}", tf.name)
+        cut_clip(job.video.name, job.frames, tf.name, start_frame, end_frame, on_write=streamer.pump)
+        manifest = streamer.finish()
+        tf.close()
 
-        self.client.publish(CLIENT_TOPIC, b64encode(clip).decode())
+        self.client.publish(CLIENT_TOPIC, manifest.encode_message(), qos=1)
         print("Sent results back to client.")
         print(f"Total bytes received: {round(self.bytes_in_total, 2)} bytes")
-        self.leader = False
+        self.finish_job(job)
 
-    # adds a node to the list of known nodes.
+    # forgets a job once it is done, keeping its video in case the next job is the same video.
+    def finish_job(self, job: Job):
+        self.jobs.pop(job.job_id, None)
+        job.close()
+        previous, self.video = self.video, job.video
+        if previous is not None and previous is not job.video and not self.video_in_use(previous):
+            previous.close()
+
+    # checks whether a video is still needed by a job or a transfer.
+    def video_in_use(self, video: ChunkAssembler) -> bool:
+        return any(job.video is video for job in self.jobs.values()) or any(
+            transfer is video for transfer in self.transfers.values()
+        )
+
+    # stops handing work to a node that left.
+    def node_left(self, node: str):
+        for job in list(self.jobs.values()):
+            if job.scheduler is not None:
+                job.scheduler.remove_node(node)
+        for transfer, vr in list(self.pending_videos.items()):
+            if vr.source == node:  # the job's leader, and its only source of the video, is gone
+                self.abandon_video(transfer)
+
+    # gives up on an accepted job whose video isn't coming, with the tasks and results held for it.
+    def abandon_video(self, transfer: str):
+        self.pending_ts.pop(transfer, None)
+        vr = self.pending_videos.pop(transfer, None)
+        if vr is None:
+            return
+        print(f"Abandoning job {vr.job}, its video never arrived")
+        self.early_results.pop(vr.job, None)
+        held = self.held_tasks.pop(vr.job, [])
+        with self.queue_lock:
+            self.queued_frames -= sum(len(task.frames()) for task in held)
+        video = self.transfers.pop(transfer, None)
+        if video is not None and video is not self.video and not self.video_in_use(video):
+            video.close()
+
+    # records a node's heartbeat in the membership.
     def heartbeat_cb(self, message: Heartbeat):
         node = message.node
-        if node not in self.node_ping:
-            self.node_ping[node] = message.status
-        if self.leader and message.status == "free" and node not in self.free_nodes:
-            self.free_nodes.append(node)
+        if self.membership.update(message):
+            print(f"{node} joined")
+        for job in list(self.jobs.values()):
+            # only nodes that have loaded the job's video can take its frames
+            if job.scheduler is not None and job.job_id in message.jobs:
+                job.scheduler.update_node(node, message.slots, message.fps, message.queue)
 
-    # gets the request from the user and broadcasts it.
+    # gets the request from the user, and waits for its video to be uploaded.
     def request_cb(self, message: VideoRequest):
-        self.leader = True
-        initial_message = RBMessage("initial", "client", message.encode_message())
-        self.client.publish(f"{BROADCAST_TOPIC}", initial_message.encode_message())
+        transfer = message.manifest.transfer
+        self.client_requests[transfer] = message
+        if self.get_transfer(transfer).set_manifest(message.manifest):
+            self.transfer_done(transfer)
+
+    # broadcasts an uploaded request as a new job, naming this node as the source of its video and the job's leader.
+    def broadcast_request(self, message: VideoRequest):
+        imgsz = message.imgsz or IMAGE_SIZE
+        vr = VideoRequest(message.target, message.manifest, self.client_name, secrets.token_hex(8), imgsz)
+        subject = f"{REQUEST_SUBJECT}/{vr.job}"
+        initial_message = RBMessage("initial", subject, vr.encode_message(), self.client_name)
+        self.client.publish(broadcast_topic(subject, "initial"), initial_message.encode_message())
+
+    # fetches the video of a request from its source, unless this node already has it.
+    def fetch_video(self, vr: VideoRequest):
+        transfer = vr.manifest.transfer
+        if transfer not in self.transfers:
+            for video in self.held_videos():
+                if video.manifest.digest == vr.manifest.digest:
+                    self.transfers[transfer] = video  # same video as a job this node already has
+                    break
+        if self.get_transfer(transfer).set_manifest(vr.manifest):
+            return
+        fetch_message = FetchRequest(self.client_name, transfer)
+        self.client.publish(f"/{vr.source}/{FETCH_INBOX}", fetch_message.encode_message())
+
+    # returns the videos of this node's jobs, and of the last finished one.
+    def held_videos(self) -> list[ChunkAssembler]:
+        videos = [job.video for job in list(self.jobs.values())]
+        if self.video is not None:
+            videos.append(self.video)
+        return videos
+
+    # sends a video this node holds to the node that asked for it.
+    def fetch_cb(self, message: FetchRequest):
+        video = self.transfers.get(message.transfer)
+        if video is None:
+            video = next((held for held in self.held_videos() if held.manifest.transfer == message.transfer), None)
+        if video is None or video.manifest.transfer != message.transfer or not video.verified:
+            return
+        with video.reader() as f:
+            send_chunks(self.client, f"/{message.node}/{CHUNK_INBOX}", video.manifest, f)
+
+    # returns the assembler for a transfer, creating it if needed.
+    def get_transfer(self, transfer: str) -> ChunkAssembler:
+        if transfer not in self.transfers:
+            self.transfers[transfer] = ChunkAssembler(transfer)
+        return self.transfers[transfer]
+
+    # writes a binary chunk of a transfer.
+    def chunk_cb(self, payload: bytes):
+        transfer, offset, data = chunk_decode(payload)
+        if self.get_transfer(transfer).add_chunk(offset, data):
+            self.transfer_done(transfer)
+
+    # hands a finished transfer to whatever was waiting on it.
+    def transfer_done(self, transfer: str):
+        if transfer in self.client_requests:
+            self.broadcast_request(self.client_requests.pop(transfer))
+        if transfer in self.pending_videos:
+            self.pending_ts.pop(transfer, None)
+            self.load_video(self.pending_videos.pop(transfer))
+
+    # decodes the video of an accepted request and starts its job.
+    def load_video(self, vr: VideoRequest):
+        video = self.transfers.pop(vr.manifest.transfer)
+        job = Job(vr.job, vr.target, video, leader=vr.source == self.client_name, imgsz=vr.imgsz, source=vr.source)
+        self.jobs[job.job_id] = job
+        for frame_id, hits in self.early_results.pop(job.job_id, {}).items():
+            job.add_result(frame_id, hits)
+        print(f"Got {job.frame_count} frames for job {job.job_id}")
+        for task in self.held_tasks.pop(job.job_id, []):
+            self.submit_task(task)
+        if job.leader:
+            # start from what the members last announced, rather than waiting for their next heartbeats
+            for node in self.membership.nodes():
+                hb = self.membership.get(node)
+                if hb is not None and job.job_id in hb.jobs:
+                    job.scheduler.update_node(node, hb.slots, hb.fps, hb.queue)
+            threading.Thread(target=self.leader_loop, args=[job], daemon=True).start()
+
+    # checks from a broadcast's topic alone whether the message can be dropped unparsed: the broadcast is done, or
+    # this node is past the phase, since a repeated initial changes nothing and echoes only matter until it readies.
+    def skip_broadcast(self, subject: str, phase: str) -> bool:
+        if subject in self.finished_broadcasts:
+            return True
+        rb = self.broadcasts.get(subject)
+        if rb is None:
+            return False
+        if phase == "initial":
+            return rb.initial_message is not None
+        if phase == "echo":
+            return rb.readied
+        return False
 
     # follows the reliable broadcast protocol.
     def broadcast_cb(self, rb_message: RBMessage):
-        if rb_message.state == "initial":
-            if rb_message.subject == "client":
-                self.broadcast_queue.append(RBInstance(self.client, self.nodes, rb_message, use_hash=True))
-            else:
-                self.broadcast_queue.append(RBInstance(self.client, self.nodes, rb_message))
-        else:
-            index = -1
-            for i in range(len(self.broadcast_queue)):
-                if rb_message.subject == self.broadcast_queue[i].subject:
-                    index = i
-                    break
-            if index == -1:
+        subject = rb_message.subject
+        if subject in self.finished_broadcasts:
+            return
+        own = rb_message.sender == self.client_name  # a leader records skipped frames before sharing them
+        if rb_message.state == "initial" and subject.startswith(RESULTS_SUBJECT) and not own:
+            job = self.jobs.get(subject_job(subject))
+            results = frameresults_decode(rb_message.data).results
+            if job is not None and all(frame_id in job.results_dict for frame_id in results):
+                # speculative copies of frames that already have a result, which only free up their node's slot
+                for frame_id, hits in results.items():
+                    job.add_result(frame_id, hits, subject_node(subject))
                 return
-            out = self.broadcast_queue[index].handle_message(rb_message)
-            if out is not None:
-                self.broadcast_queue.pop(index)
-
-                if out.subject == "client":  # client's video request
-                    self.image_dict = {}
-                    vr = videorequest_decode(out.data)
-                    video_bytes = b64decode(vr.video)
-                    tf = tempfile.NamedTemporaryFile(suffix=".mp4")
-                    tf.write(video_bytes)
-                    cap = cv.VideoCapture(tf.name)
-
-                    check, im = cap.read()
-                    frame = 0
-                    while check:
-                        self.image_dict[frame] = im
-                        check, im = cap.read()
-                        frame += 1
-
-                    self.target = vr.target
-                    self.results_dict = {}
-                    self.processing_queue = []
-                    print(f"Got {len(self.image_dict.keys())} frames")
-                    if self.leader:
-                        threading.Thread(target=self.leader_loop, daemon=True).start()
-
-                if out.subject.isdigit():  # frame data
-                    frame_id = int(out.subject)
-                    self.results_dict[frame_id] = int(out.data) if int(out.data) > 0 else -1
-                    try:
-                        self.processing_queue.remove(frame_id)
-                    except Exception:
-                        pass
-
-    # handle a command from the leader
-    def command_cb(self, task_id: int):
-        print(f"Processing task {task_id}")
-        self.busy = True
-        image = self.image_dict[task_id]
-        start_ts = time.time()
-        hits = self.predictor.image_predict(image, target=self.target)
-        self.processing_time += time.time() - start_ts
-        initial_message = RBMessage("initial", str(task_id), str(hits))
-        self.client.publish(f"{BROADCAST_TOPIC}", initial_message.encode_message())
-        self.busy = False
-        print(f"Done with task {task_id}")
+
+        rb = self.broadcasts.get(subject)
+        if rb is None:
+            # agree on the request's digest while the video is pulled from its source
+            use_hash = subject.startswith(REQUEST_SUBJECT)
+            rb = RBInstance(self.client, self.membership.nodes(), subject, self.client_name, use_hash=use_hash)
+            self.broadcasts[subject] = rb
+        if rb_message.state == "initial" and subject.startswith(REQUEST_SUBJECT) and rb.initial_message is None:
+            self.fetch_video(videorequest_decode(rb_message.data))
+
+        out = rb.handle_message(rb_message)
+        if out is not None:
+            self.broadcasts.pop(subject, None)
+            self.finished_broadcasts[subject] = time.time()
+
+            if out.subject.startswith(REQUEST_SUBJECT):  # client's video request, starting a job
+                vr = videorequest_decode(out.data)
+                transfer = vr.manifest.transfer
+                if self.get_transfer(transfer).set_manifest(vr.manifest):
+                    self.load_video(vr)
+                else:
+                    self.pending_videos[transfer] = vr
+                    self.pending_ts[transfer] = time.time()
+                    self.early_results[vr.job] = {}
+                    self.held_tasks[vr.job] = []
+
+            if out.subject.startswith(RESULTS_SUBJECT):  # a batch of frame results, first result per frame wins
+                results = frameresults_decode(out.data).results
+                job = self.jobs.get(subject_job(out.subject))
+                if job is None:
+                    # the job's video is still on its way, or the job is already done here
+                    early = self.early_results.get(subject_job(out.subject))
+                    if early is not None:
+                        for frame_id, hits in results.items():
+                            early.setdefault(frame_id, hits)
+                    return
+                for frame_id, hits in results.items():
+                    job.add_result(frame_id, hits, subject_node(out.subject))
+                if job.complete() and not job.leader:  # the leader finishes the job once the clip is sent
+                    self.finish_job(job)
+
+    # broadcasts frame results off the inference thread, gathering them into one broadcast per batch.
+    def result_loop(self):
+        while True:
+            job_id, results = self.result_queue.get()
+            batches = {job_id: results}  # results gathered per job, each job's go into their own broadcast
+            count = len(results)
+            flush_ts = time.time() + RESULT_FLUSH_SECONDS
+            while count < RESULT_BATCH_SIZE and time.time() < flush_ts:
+                try:
+                    job_id, results = self.result_queue.get(timeout=max(0, flush_ts - time.time()))
+                except queue.Empty:
+                    break
+                batches.setdefault(job_id, {}).update(results)
+                count += len(results)
+
+            for job_id, results in batches.items():
+                subject = f"{RESULTS_SUBJECT}/{job_id}/{self.client_name}/{next(self.result_batches)}"
+                message = FrameResults(results).encode_message()
+                initial_message = RBMessage("initial", subject, message, self.client_name)
+                self.client.publish(broadcast_topic(subject, "initial"), initial_message.encode_message())
+
+    # queues a task from a leader for the inference threads, holding it if its job's video is still on its way.
+    def submit_task(self, task: TaskCommand):
+        if task.job not in self.jobs and task.job in self.held_tasks:
+            self.held_tasks[task.job].append(task)
+            return
+        if not self.executor.submit(task):
+            # several leaders can fill the queue at once, so hand the shard straight back to its leader
+            print(f"Task queue full, rejecting frames {task.start}-{task.end - 1}")
+            with self.queue_lock:
+                self.queued_frames -= len(task.frames())
+                queued = self.queued_frames
+            job = self.jobs.get(task.job)
+            if job is not None:
+                reject = TaskReject(self.client_name, task.job, task.start, task.end, queued)
+                self.client.publish(f"/{job.source}/{REJECT_INBOX}", reject.encode_message())
+
+    # hands a shard a node had no room for back to the job's scheduler.
+    def reject_cb(self, message: TaskReject):
+        job = self.jobs.get(message.job)
+        if job is not None and job.scheduler is not None:
+            job.scheduler.reject(message.node, message.start, message.end, message.queue)
+
+    # handle a command from the leader, on one of the executor's inference threads
+    def command_cb(self, task: TaskCommand, predictor: ImagePredictor):
+        job = self.jobs.get(task.job)
+        if job is None:
+            print(f"Dropping frames {task.start}-{task.end - 1} of unknown job {task.job}")
+            with self.queue_lock:
+                self.queued_frames -= len(task.frames())
+            return
+        print(f"Processing frames {task.start}-{task.end - 1} of job {task.job}")
+        frames = task.frames()
+        processed = 0  # frames taken off queued_frames so far
+        try:
+            for batch_start in range(0, len(frames), BATCH_SIZE):
+                batch = frames[batch_start : batch_start + BATCH_SIZE]
+                task_ids = []
+                images = []
+                for task_id, image in job.frames.get_range(batch.start, batch.stop, batch.step):
+                    task_ids.append(task_id)
+                    images.append(image)
+
+                start_ts = time.time()
+                hits = predictor.image_predict_batch(images, target=job.target, imgsz=job.imgsz) if images else []
+                elapsed = time.time() - start_ts
+                self.processing_time += elapsed
+                if images and elapsed > 0:
+                    fps = len(images) / elapsed
+                    self.fps = fps if self.fps == 0 else LATENCY_SMOOTHING * fps + (1 - LATENCY_SMOOTHING) * self.fps
+
+                # frames past the end of the video (the container reported too many) count as no hits
+                results = dict(zip(task_ids, hits))
+                results = {task_id: results.get(task_id, 0) for task_id in batch}
+                self.result_queue.put((task.job, results))
+                with self.queue_lock:
+                    self.queued_frames -= len(batch)
+                processed += len(batch)
+        finally:
+            # a failed batch leaves the rest of the shard to the leader, so don't keep advertising it
+            with self.queue_lock:
+                self.queued_frames -= len(frames) - processed
+        print(f"Done with frames {task.start}-{task.end - 1}")
 
     # subscribe to topics
     def on_connect(self, client: MQTT.Client, userdata, flags, reason_code, properties):
-        client.subscribe(f"{HEARTBEAT_TOPIC}")
+        client.subscribe(heartbeat_topic("+"))
         client.subscribe(f"/{self.client_name}/{REQUEST_INBOX}")
-        client.subscribe(f"{BROADCAST_TOPIC}")
+        client.subscribe(f"{BROADCAST_TOPIC}/#")
         client.subscribe(f"/{self.client_name}/{CMD_INBOX}")
+        client.subscribe(f"/{self.client_name}/{CHUNK_INBOX}")
+        client.subscribe(f"/{self.client_name}/{FETCH_INBOX}")
+        client.subscribe(f"/{self.client_name}/{REJECT_INBOX}")
 
     # specify callbacks
     def on_message(self, client: MQTT.Client, userdata, message: MQTT.MQTTMessage):
         self.bytes_in_total += len(message.payload)
-        if message.topic.endswith(HEARTBEAT_TOPIC):
-            hb = heartbeat_decode(message.payload.decode())
+        if message.topic.startswith(f"{BROADCAST_TOPIC}/"):
+            subject, phase = parse_broadcast_topic(message.topic)
+            if self.skip_broadcast(subject, phase):
+                return
+            rb_message = rbmessage_decode(message.payload)
+            self.broadcast_cb(rb_message)
+            del rb_message
+        elif message.topic.startswith(f"{HEARTBEAT_TOPIC}/"):
+            if not message.payload:  # the node's last will, or its retained heartbeat being cleared
+                node = parse_heartbeat_topic(message.topic)
+                if self.membership.remove(node):
+                    print(f"{node} left")
+                    self.node_left(node)
+                return
+            hb = heartbeat_decode(message.payload)
             self.heartbeat_cb(hb)
             del hb
         elif message.topic.endswith(REQUEST_INBOX):
-            vr = videorequest_decode(message.payload.decode())
+            vr = videorequest_decode(message.payload)
             self.request_cb(vr)
-        elif message.topic.endswith(BROADCAST_TOPIC):
-            rb_message = rbmessage_decode(message.payload.decode())
-            self.broadcast_cb(rb_message)
-            del rb_message
+        elif message.topic.endswith(CHUNK_INBOX):
+            self.chunk_cb(message.payload)
+        elif message.topic.endswith(FETCH_INBOX):
+            fr = fetchrequest_decode(message.payload)
+            threading.Thread(target=self.fetch_cb, args=[fr], daemon=True).start()
+        elif message.topic.endswith(REJECT_INBOX):
+            self.reject_cb(taskreject_decode(message.payload))
         elif message.topic.endswith(CMD_INBOX):
             print('got a command')
-            threading.Thread(target=self.command_cb, args=[int(message.payload.decode())], daemon=True).start()
+            task = taskcommand_decode(message.payload)
+            with self.queue_lock:
+                self.queued_frames += len(task.frames())
+            self.submit_task(task)